@@ -0,0 +1,100 @@
+"""Benchmark the construction of the agents and tools of a crew, with and without their memoization per crew.
+
+Builds what `CrewRunner.run_crew` builds for a crew attempt - `_generate_agents` and `_get_crew_tasks` - for a
+crew of 3 tasks on 2 agents, on the offline stub LLM and tools that need no credentials. Run from the repository root:
+
+    python -m benchmarks.crew_construction [--runs 30]
+"""
+import argparse
+import contextlib
+import io
+import statistics
+import time
+import tracemalloc
+import typing
+
+import rich
+from rich.table import Table
+
+from execution.crews.builder import CrewRunner
+from llms.stub import StubChatModel
+from tools.index import get_tool
+
+CREW_CONFIG: dict = {
+    'agents': {
+        'researcher': {'role': 'Researcher of {topic}', 'goal': 'Find where {topic} is implemented',
+                       'backstory': 'A developer who knows the codebase', 'tools': ['git_search', 'read_file']},
+        'writer': {'role': 'Technical writer', 'goal': 'Document {topic}',
+                   'backstory': 'A writer of developer documentation', 'tools': ['read_file']},
+    },
+    'tasks': {
+        'search': {'agent': 'researcher', 'description': 'Search the code of {topic}',
+                   'expected_output': 'The files implementing {topic}'},
+        'summarize': {'agent': 'researcher', 'description': 'Summarize the implementation of {topic}',
+                      'expected_output': 'A summary', 'tools': ['fetch_file_content']},
+        'write': {'agent': 'writer', 'description': 'Write the documentation of {topic}',
+                  'expected_output': 'A markdown document'},
+    },
+}
+
+
+class UnmemoizedCrewRunner(CrewRunner):
+    """Builds an agent, and its tools, for every task and again for the crew - as before they were memoized."""
+
+    def _get_agent(self, agent_name: str):
+        return self._build_agent(agent_name)
+
+    def _get_tool(self, tool_name: str, scope: typing.Optional[str] = None):
+        return get_tool(tool_name, task_id=self._get_tool_id(scope))
+
+
+def build_crew(runner_class: type[CrewRunner]) -> tuple[list, list]:
+    runner: CrewRunner = runner_class('benchmark', 'crew', CREW_CONFIG, {'topic': 'the response cache'}, {},
+                                      StubChatModel(), None, should_export_results=False)
+    return runner._generate_agents(), runner._get_crew_tasks()
+
+
+def measure(runner_class: type[CrewRunner], runs: int) -> dict:
+    with contextlib.redirect_stdout(io.StringIO()):
+        build_crew(runner_class)  # imports and first-use setup of the tools
+        durations: list[float] = []
+        for _ in range(runs):
+            started_at: float = time.perf_counter()
+            build_crew(runner_class)
+            durations.append(time.perf_counter() - started_at)
+        tracemalloc.start()
+        agents, tasks = build_crew(runner_class)
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {
+        'agents': len({id(agent) for agent in agents} | {id(task.agent) for task in tasks}),
+        'median': statistics.median(durations),
+        'min': min(durations),
+        'retained': retained,
+        'peak': peak,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', help='Number of timed builds of each variant', type=int, default=30)
+    args = parser.parse_args()
+
+    table = Table(title=f'Crew construction - 3 tasks on 2 agents, median of {args.runs} builds')
+    for column in ('Variant', 'Agent objects', 'Median (ms)', 'Min (ms)', 'Retained (KiB)', 'Peak (KiB)'):
+        table.add_column(column, justify='left' if column == 'Variant' else 'right')
+    for name, runner_class in (('per reference', UnmemoizedCrewRunner), ('memoized per crew', CrewRunner)):
+        result: dict = measure(runner_class, args.runs)
+        table.add_row(
+            name,
+            str(result['agents']),
+            f"{result['median'] * 1000:.1f}",
+            f"{result['min'] * 1000:.1f}",
+            f"{result['retained'] / 1024:.0f}",
+            f"{result['peak'] / 1024:.0f}",
+        )
+    rich.print(table)
+
+
+if __name__ == '__main__':
+    main()
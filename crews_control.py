@@ -5,11 +5,13 @@ import argparse
 import rich
 from rich.padding import Padding
 import os
+from concurrent.futures import ThreadPoolExecutor
 from execution.inputs import get_user_inputs, validate_user_inputs
 from execution.orchestrator import execute_crews, get_execution_config
 from models import RuntimeSettings
 from pathlib import Path
-from execution.consts import EXECUTION_CONFIG_PATH
+from execution.cache import get_crew_results_cache
+from execution.consts import CACHE_DIRECTORY_PATH, CACHE_MAX_SIZE_MB, EXECUTION_CONFIG_PATH
 from utils import EnvironmentVariableNotSetError, is_safe_path
 
 class KeyValueAction(argparse.Action):
@@ -24,7 +26,13 @@ def parse_arguments():
 
     parser.add_argument("--project-name", help="The name of the project to run.", type=str)
     parser.add_argument("--ignore-cache", help="Ignore the cache and run all crews", action="store_true")
+    parser.add_argument("--cache-dir", help="Directory of the crews results cache", type=str, default=CACHE_DIRECTORY_PATH)
+    parser.add_argument("--cache-max-size-mb", help="Maximum size of the crews results cache (MB)", type=int, default=CACHE_MAX_SIZE_MB)
     parser.add_argument('--params', nargs='+', action=KeyValueAction, help='List of key=value pairs')
+    parser.add_argument("--rerun-from", help="Rerun the given crew and all the crews downstream of it", type=str)
+    parser.add_argument("--max-parallel-crews", help="Maximum number of independent crews to run concurrently", type=int, default=1)
+    parser.add_argument("--stream-output", help="Stream the crews outputs into the output files while they are generated", action="store_true")
+    parser.add_argument("--benchmark-workers", help="Number of benchmark executions to run concurrently", type=int, default=1)
     
     group = parser.add_mutually_exclusive_group()
     group.add_argument("--list-tools", help="List available tools", action="store_true")
@@ -34,6 +42,11 @@ def parse_arguments():
     
     args = parser.parse_args()
 
+    if args.max_parallel_crews < 1:
+        parser.error("--max-parallel-crews must be at least 1")
+    if args.benchmark_workers < 1:
+        parser.error("--benchmark-workers must be at least 1")
+
     # Ensure project name is provided if not listing
     if not (args.list_tools or args.list_models or args.list_projects):
         if not args.project_name:
@@ -62,7 +75,7 @@ def display_error(message):
 def display_message(message):
     rich.print(Padding(f"[bold white]{message}[/bold white]", (2, 4), expand=True, style="bold white"))
 
-def execute_project(runtime_settings, execution_config, user_inputs=None, validations=None):
+def execute_project(runtime_settings, execution_config, user_inputs=None, validations=None, execution_id=None):
     try:
         validate_user_inputs(user_inputs=user_inputs or {}, execution_config=execution_config)
     except ValueError as e:
@@ -71,9 +84,35 @@ def execute_project(runtime_settings, execution_config, user_inputs=None, valida
         project_name=runtime_settings.project_name,
         user_inputs=user_inputs or get_user_inputs(execution_config),
         validations=validations,
-        ignore_cache=runtime_settings.ignore_cache
+        ignore_cache=runtime_settings.ignore_cache,
+        max_parallel_crews=runtime_settings.max_parallel_crews,
+        execution_id=execution_id,
+        results_cache=get_crew_results_cache(runtime_settings.cache_dir, runtime_settings.cache_max_size_mb),
+        rerun_from=runtime_settings.rerun_from,
+        stream_output=runtime_settings.stream_output,
     )
 
+def run_benchmark(runtime_settings, execution_config, executions):
+    """Run the benchmark executions, up to `benchmark_workers` of them concurrently.
+
+    Each execution writes its outputs and validation results to paths of its own.
+    """
+    def run_execution(index, execution):
+        rich.print(f"[grey]Running benchmark execution: <{index}>[/grey]")
+        execute_project(runtime_settings,
+                        execution_config,
+                        execution.get('user_inputs'),
+                        execution.get('validations'),
+                        execution_id=f'execution_{index}')
+
+    executor = ThreadPoolExecutor(max_workers=runtime_settings.benchmark_workers)
+    try:
+        futures = [executor.submit(run_execution, index, execution) for index, execution in enumerate(executions)]
+        for future in futures:
+            future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
 def main():
     args = parse_arguments()
     handle_list_arguments(args)
@@ -81,7 +120,13 @@ def main():
     runtime_settings = RuntimeSettings(
         project_name=args.project_name,
         benchmark_mode=args.benchmark,
-        ignore_cache=args.ignore_cache
+        ignore_cache=args.ignore_cache,
+        max_parallel_crews=args.max_parallel_crews,
+        benchmark_workers=args.benchmark_workers,
+        cache_dir=args.cache_dir,
+        cache_max_size_mb=args.cache_max_size_mb,
+        rerun_from=args.rerun_from,
+        stream_output=args.stream_output,
     )
 
     project_path = Path.cwd() / 'projects' / runtime_settings.project_name
@@ -93,15 +138,19 @@ def main():
     except FileNotFoundError:
         display_error(f"{EXECUTION_CONFIG_PATH} file not found for project {runtime_settings.project_name}")
 
+    if runtime_settings.rerun_from and runtime_settings.rerun_from not in (execution_config.get('crews') or {}):
+        display_error(f"Crew {runtime_settings.rerun_from} not found in project {runtime_settings.project_name}")
+
     display_message(f"Welcome to {runtime_settings.project_name}™")
 
     try:
         if runtime_settings.benchmark_mode:
             from utils import report_success_percentage
+            from execution.validation import wait_for_validations
             benchmark_settings = runtime_settings.load_benchmark_file()
-            for index, execution in enumerate(benchmark_settings.get('executions') or []):
-                rich.print(f"[grey]Running benchmark execution: <{index}>[/grey]")
-                execute_project(runtime_settings, execution_config, execution.get('user_inputs'), execution.get('validations'))
+            run_benchmark(runtime_settings, execution_config, benchmark_settings.get('executions') or [])
+            # validations run in the background, batched across the executions
+            wait_for_validations()
         elif args.params:
             user_inputs = {k: v for k, v in args.params.items()}
             execute_project(runtime_settings, execution_config, user_inputs)
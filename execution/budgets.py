@@ -0,0 +1,141 @@
+import re
+import string
+import typing
+
+from llms.tokens import get_encoding
+
+TRUNCATION_STRATEGIES = ('head_tail', 'head', 'tail', 'sections')
+DEFAULT_TRUNCATION_STRATEGY = 'head_tail'
+_SECTION_HEADING_PATTERN = re.compile(r'^(?=#{1,6} )', re.MULTILINE)
+
+
+class TokenBudget(typing.NamedTuple):
+    max_tokens: int
+    strategy: str = DEFAULT_TRUNCATION_STRATEGY
+
+
+def parse_budget(value: typing.Union[int, str, dict]) -> TokenBudget:
+    """Parse a budget of the `budgets` block (`2000` or `{max_tokens: 2000, strategy: sections}`)
+    or of a template field (`max_tokens=2000` or `max_tokens=2000,strategy=sections`)."""
+    if isinstance(value, int):
+        return TokenBudget(max_tokens=value)
+    if isinstance(value, str):
+        value = dict(item.split('=', 1) for item in value.split(',') if item.strip())
+    try:
+        budget = TokenBudget(max_tokens=int(value['max_tokens']),
+                             strategy=value.get('strategy') or DEFAULT_TRUNCATION_STRATEGY)
+    except (KeyError, ValueError, TypeError):
+        raise ValueError(f'Invalid token budget: {value} (expected max_tokens=<number>[,strategy=<strategy>])')
+    if budget.strategy not in TRUNCATION_STRATEGIES:
+        raise ValueError(f'Invalid truncation strategy: {budget.strategy} (expected one of {TRUNCATION_STRATEGIES})')
+    return budget
+
+
+def _encode(text: str) -> list:
+    encoding = get_encoding()
+    # without a tokenizer, ~4 characters per token
+    return encoding.encode(text, disallowed_special=()) if encoding else [text[i:i + 4] for i in range(0, len(text), 4)]
+
+
+def _decode(tokens: list) -> str:
+    encoding = get_encoding()
+    return encoding.decode(tokens) if encoding else ''.join(tokens)
+
+
+def _truncation_marker(truncated_tokens: int) -> str:
+    return f'\n[... {truncated_tokens} tokens truncated ...]\n'
+
+
+def _cut(tokens: list, keep: int, strategy: str) -> str:
+    """Keep `keep` of the tokens of a text - its beginning (head), its end (tail) or both (head_tail) - with a marker."""
+    marker: str = _truncation_marker(len(tokens) - keep)
+    if strategy == 'head':
+        return _decode(tokens[:keep]) + marker
+    if strategy == 'tail':
+        return marker + (_decode(tokens[-keep:]) if keep else '')
+    head: int = (keep + 1) // 2
+    tail: int = keep - head
+    return _decode(tokens[:head]) + marker + (_decode(tokens[-tail:]) if tail else '')
+
+
+def truncate_text(text: str, budget: TokenBudget) -> tuple[str, int]:
+    """Truncate a text to its token budget. Returns the text and its original number of tokens.
+
+    Strategies:
+    - head_tail: keep the beginning and the end of the text,
+    - head / tail: keep the beginning / the end of the text,
+    - sections: keep every markdown section (or paragraph, if there are no headings), each cut to an equal share.
+    The truncation markers count in the budget, so the truncated text is at most `max_tokens` tokens.
+    """
+    tokens: list = _encode(text)
+    if len(tokens) <= budget.max_tokens:
+        return text, len(tokens)
+
+    if budget.strategy == 'sections':
+        sections: list[str] = [section for section in _SECTION_HEADING_PATTERN.split(text) if section.strip()]
+        if len(sections) < 2:
+            sections = [section for section in re.split(r'(?<=\n\n)', text) if section.strip()]
+        if 1 < len(sections) <= budget.max_tokens:
+            share: int = budget.max_tokens // len(sections)
+            truncated_text: str = ''.join(
+                truncate_text(section, TokenBudget(max_tokens=share, strategy='head'))[0] for section in sections
+            )
+            # sections joined back may encode to a few more tokens than apart
+            if len(_encode(truncated_text)) <= budget.max_tokens:
+                return truncated_text, len(tokens)
+    strategy: str = budget.strategy if budget.strategy in ('head', 'tail') else 'head_tail'
+    # the marker is at most as long as the one of the whole text - and, as above, the kept tokens and the
+    # marker may encode to a few more tokens once joined, so the kept tokens shrink until the text fits
+    keep: int = budget.max_tokens - len(_encode(_truncation_marker(len(tokens))))
+    while keep >= 0:
+        truncated_text = _cut(tokens, keep, strategy)
+        if len(_encode(truncated_text)) <= budget.max_tokens:
+            return truncated_text, len(tokens)
+        keep -= 1
+    # a budget too small for the marker
+    return _decode(tokens[:budget.max_tokens]), len(tokens)
+
+
+class _BudgetedValue(typing.NamedTuple):
+    name: str
+    value: typing.Any
+
+
+class BudgetFormatter(string.Formatter):
+    """`str.format_map` that truncates the variables to their token budgets.
+
+    A budget is given in the template field (`{stage_1_result:max_tokens=2000}`) or in `budgets`
+    (variable name -> budget, see `parse_budget`). `on_truncate(name, original_tokens, budget)` is called
+    for each variable cut. Variables are assumed not to change during the formatter lifetime - each one is
+    truncated once.
+    """
+
+    def __init__(self, budgets: typing.Optional[dict] = None,
+                 on_truncate: typing.Optional[typing.Callable[[str, int, TokenBudget], None]] = None):
+        self._budgets: dict[str, TokenBudget] = {name: parse_budget(budget) for name, budget in (budgets or {}).items()}
+        self._on_truncate = on_truncate
+        self._truncated: dict[tuple[str, TokenBudget], str] = {}
+
+    def get_field(self, field_name, args, kwargs):
+        value, first = super().get_field(field_name, args, kwargs)
+        return (_BudgetedValue(field_name, value) if isinstance(value, str) else value), first
+
+    def format_field(self, value, format_spec: str):
+        if not isinstance(value, _BudgetedValue):
+            return super().format_field(value, format_spec)
+        budget: typing.Optional[TokenBudget] = self._budgets.get(value.name)
+        if format_spec.startswith('max_tokens='):
+            budget, format_spec = parse_budget(format_spec), ''
+        if budget is None:
+            return super().format_field(value.value, format_spec)
+        if (value.name, budget) not in self._truncated:
+            text, original_tokens = truncate_text(value.value, budget)
+            if original_tokens > budget.max_tokens and self._on_truncate:
+                self._on_truncate(value.name, original_tokens, budget)
+            self._truncated[(value.name, budget)] = text
+        return super().format_field(self._truncated[(value.name, budget)], format_spec)
+
+    def convert_field(self, value, conversion):
+        if isinstance(value, _BudgetedValue) and conversion is not None:
+            return _BudgetedValue(value.name, super().convert_field(value.value, conversion))
+        return super().convert_field(value, conversion)
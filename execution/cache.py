@@ -0,0 +1,91 @@
+import functools
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import typing
+from pathlib import Path
+
+import rich
+
+CACHE_FILE_SUFFIX = '.result'
+
+
+class CrewResultsCache:
+    """Content-addressed cache of crew results.
+
+    Each result is stored in its own file under `cache_dir`, named by the hash of everything the crew
+    consumed (see `make_key`). The total size of the stored results is capped by `max_size_bytes` -
+    when exceeded, the least recently used results are evicted.
+    Safe to share between threads (concurrent crews and benchmark executions).
+    """
+
+    def __init__(self, cache_dir: typing.Union[str, Path], max_size_bytes: int):
+        self._cache_dir: Path = Path(cache_dir)
+        self._max_size_bytes: int = max_size_bytes
+        self._lock = threading.Lock()
+        self._cache_dir.mkdir(parents=True, exist_ok=True)
+        self._size_bytes: int = sum(path.stat().st_size for path in self._entries())
+
+    @staticmethod
+    def make_key(payload: dict) -> str:
+        """Hash a JSON serializable payload into a cache key."""
+        serialized: str = json.dumps(payload, sort_keys=True, default=str)
+        return hashlib.sha256(serialized.encode()).hexdigest()
+
+    def get(self, key: str) -> typing.Optional[str]:
+        path: Path = self._get_path(key)
+        with self._lock:
+            try:
+                result: str = path.read_text()
+            except FileNotFoundError:
+                return None
+            # mark as recently used
+            os.utime(path)
+            return result
+
+    def set(self, key: str, result: str):
+        path: Path = self._get_path(key)
+        data: bytes = result.encode()
+        if len(data) > self._max_size_bytes:
+            rich.print(f"[yellow]Result is larger than the cache size limit, not caching it.[/yellow]")
+            return
+
+        with self._lock:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            previous_size: int = path.stat().st_size if path.exists() else 0
+            # write atomically so concurrent readers never see a partial result
+            fd, temp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as file:
+                file.write(data)
+            os.replace(temp_path, path)
+            self._size_bytes += len(data) - previous_size
+            self._evict()
+
+    def _evict(self):
+        """Remove the least recently used results until the cache fits its size limit."""
+        if self._size_bytes <= self._max_size_bytes:
+            return
+        entries: list[tuple[float, int, Path]] = sorted(
+            (stat.st_mtime, stat.st_size, path)
+            for path in self._entries()
+            for stat in [path.stat()]
+        )
+        for _, size, path in entries:
+            if self._size_bytes <= self._max_size_bytes:
+                break
+            path.unlink(missing_ok=True)
+            self._size_bytes -= size
+
+    def _entries(self) -> typing.Iterator[Path]:
+        return self._cache_dir.glob(f'*/*{CACHE_FILE_SUFFIX}')
+
+    def _get_path(self, key: str) -> Path:
+        return self._cache_dir / key[:2] / f'{key}{CACHE_FILE_SUFFIX}'
+
+
+@functools.lru_cache(maxsize=None)
+def get_crew_results_cache(cache_dir: str, max_size_mb: int) -> CrewResultsCache:
+    """Get the process-wide results cache of the given directory."""
+    return CrewResultsCache(cache_dir=cache_dir, max_size_bytes=max_size_mb * 1024 * 1024)
@@ -4,4 +4,11 @@ import os
 EXECUTION_CONFIG_PATH: typing.Final[str] = "execution.yaml"
 BENCHMARK_CONFIG_PATH: typing.Final[str] = "benchmark.yaml"
 OUTPUT_DIRECTORY_PATH: str = 'output'
+CACHE_DIRECTORY_PATH: str = 'db/crews-cache'
+CACHE_MAX_SIZE_MB: int = 512
+# benchmark validations are batched into judge calls of up to this many validations / prompt tokens,
+# sent once full or once the oldest validation waited this long
+VALIDATION_BATCH_SIZE: int = 8
+VALIDATION_BATCH_MAX_TOKENS: int = 60000
+VALIDATION_BATCH_WAIT_SECONDS: float = 30.0
 EXIT_ON_ERROR = os.getenv('EXIT_ON_ERROR', 'False').lower() == 'true'
@@ -1,3 +1,4 @@
+import collections
 import hashlib
 import os
 import typing
@@ -5,12 +6,21 @@ from pathlib import Path
 import time
 import rich
 from crewai import Task, Agent, Crew
+from crewai.tasks.task_output import TaskOutput
+from execution.budgets import BudgetFormatter, TokenBudget
+from execution.cache import CrewResultsCache
 from execution.contexts import load_crew_contexts
+from execution.ledger import UsageLedger
 from execution.consts import EXIT_ON_ERROR
+from execution.streaming import StreamingExport, write_atomically
+from llms.rate_limiter import get_client_rate_limiter, get_retry_after
 from tools.index import get_tool
-from utils import is_safe_path
+from utils import copy_llm_client, get_client_fingerprint, is_safe_path
 import re
 
+# server errors worth retrying, in addition to rate limit errors (429)
+TRANSIENT_ERROR_CODES = {"500", "502", "503", "504"}
+
 class NoAgentFoundError(Exception):
     pass
 
@@ -24,20 +34,39 @@ class CrewRunner:
         crew_name: str,
         crew_config: dict,
         user_inputs: dict,
-        previous_crews_results: dict,
+        previous_crews_results: typing.Mapping[str, str],
         llm,
         embedding_model,
         should_export_results: bool = True,
         ignore_cache: bool = False,
+        output_subdirectory: typing.Optional[str] = None,
+        results_cache: typing.Optional[CrewResultsCache] = None,
+        stream_output: bool = False,
+        ledger: typing.Optional[UsageLedger] = None,
+        llms: typing.Optional[typing.Mapping[str, typing.Any]] = None,
     ):
         self._crew_name: str = crew_name
         self._user_input: dict = user_inputs
         self._crew_config: dict = crew_config
         self._project_name: str = project_name
-        self._previous_results: dict = previous_crews_results
+        self._previous_results: typing.Mapping[str, str] = previous_crews_results
         self._llm, self._embedding_model = llm, embedding_model
+        # clients of the LLMs named by the `llm` key of the crew and its agents, `llm` is the default
+        self._llms: typing.Mapping[str, typing.Any] = llms or {}
         self._crew_context: typing.Optional[dict] = None
         self._ignore_cache: bool = ignore_cache
+        # per-variable token budgets - `{variable:max_tokens=N}` in the templates or the crew `budgets` block
+        self._formatter = BudgetFormatter(crew_config.get('budgets'), on_truncate=self._report_truncation)
+        self._output_subdirectory: typing.Optional[str] = output_subdirectory
+        self._results_cache: typing.Optional[CrewResultsCache] = results_cache
+        self.failed: bool = False
+        self._stream: typing.Optional[StreamingExport] = None
+        self._ledger: typing.Optional[UsageLedger] = ledger
+        # outputs of the tasks completed in the current run (tasks run sequentially), so retries can resume
+        self._task_outputs: list[TaskOutput] = []
+        # agents and tools are built once per crew and shared by the crew and its tasks
+        self._agents: dict[str, Agent] = {}
+        self._tools: dict[tuple[str, typing.Optional[str]], typing.Any] = {}
 
         # evaluate paths
         for key, value in (crew_config.get('context') or {}).items():
@@ -48,6 +77,8 @@ class CrewRunner:
 
         # output file
         self._should_export_results: bool = should_export_results
+        if stream_output and should_export_results:
+            self._stream = StreamingExport(self._get_export_path())
 
         # validate results
         self._validate_results: str = self._evaluate_input(crew_config.get('validate_results') or '')
@@ -70,14 +101,25 @@ class CrewRunner:
         try:
             user_input = self._strip_sha256(user_input)
 
-            return user_input.format(
-                **(self._crew_context or {}),
-                **(self._user_input or {}),
-                **(self._previous_results or {})
-            )
-        except ValueError as e:
+            # lookups are lazy - only the previous results a template references are loaded
+            return self._formatter.vformat(user_input, (), self._template_variables)
+        except (ValueError, IndexError) as e:
             raise ValueError(f'\nError evaluating input: {e}\nUser input:\n---\n{user_input}\n---\n')
 
+    def _report_truncation(self, variable_name: str, original_tokens: int, budget: TokenBudget):
+        rich.print(
+            f"[yellow]Crew <{self._crew_name}>: variable <{variable_name}> truncated from {original_tokens} "
+            f"to {budget.max_tokens} tokens ({budget.strategy})[/yellow]"
+        )
+
+    @property
+    def _template_variables(self) -> collections.ChainMap:
+        return collections.ChainMap(
+            self._crew_context or {},
+            self._user_input or {},
+            self._previous_results or {},
+        )
+
     def _strip_sha256(self, user_input: str) -> str:
         sha256_pattern = re.compile(r'\{sha256:(\w+)\}')
         return sha256_pattern.sub(r'{\1}', user_input)
@@ -117,19 +159,29 @@ class CrewRunner:
             return hashlib.md5(f'{self._crew_name}{list(self._user_input.values())}'.lower().encode()).hexdigest()
         return hashlib.md5(f'{self._crew_name}{scope}{list(self._user_input.values())}'.lower().encode()).hexdigest()
 
-    def _get_agent(self, agent_name: str, agent_scope: typing.Optional[str] = None) -> Agent:
+    def _get_tool(self, tool_name: str, scope: typing.Optional[str] = None):
+        if (tool_name, scope) not in self._tools:
+            self._tools[(tool_name, scope)] = get_tool(tool_name, task_id=self._get_tool_id(scope))
+        return self._tools[(tool_name, scope)]
+
+    def _get_agent(self, agent_name: str) -> Agent:
+        if agent_name not in self._agents:
+            self._agents[agent_name] = self._build_agent(agent_name)
+        return self._agents[agent_name]
+
+    def _build_agent(self, agent_name: str) -> Agent:
         agent_config: dict = self._crew_config['agents'].get(agent_name)
         try:
             return Agent(
                 role=self._evaluate_input(agent_config['role']),
                 goal=self._evaluate_input(agent_config['goal']),
                 tools=[
-                    get_tool(tool, task_id=self._get_tool_id(agent_scope))
+                    self._get_tool(tool)
                     for tool in agent_config.get('tools') or []
                 ],
                 backstory=self._evaluate_input(agent_config['backstory']),
                 allow_delegation=False,
-                llm=self._llm,
+                llm=self._get_agent_llm(agent_name),
                 embedding_model=self._embedding_model,
                 verbose=True,
                 memory=True,
@@ -137,16 +189,76 @@ class CrewRunner:
         except ValueError as e:
             raise ValueError(f'Error evaluating agent: {agent_name}. Error: {e}')
 
+    def _get_agent_llm(self, agent_name: str):
+        """Get a copy of the LLM client of an agent with the streaming and ledger callbacks of the crew.
+
+        The callbacks of the agent itself stay on its executor and never reach the LLM runs, the client callbacks do.
+        """
+        llm = self._get_llm(agent_name)
+        callbacks: list = [
+            *([self._stream] if self._stream else []),
+            *([self._ledger.get_callback_handler(self._crew_name, agent_name, self._get_current_task_name,
+                                                 llm_name=self._get_llm_name(agent_name))]
+              if self._ledger else []),
+        ]
+        if not callbacks:
+            return llm
+        update: dict = {'callbacks': [*(llm.callbacks or []), *callbacks]}
+        if self._stream and 'streaming' in type(llm).__fields__:
+            # tokens are only reported to the callbacks when the client streams
+            update['streaming'] = True
+        return copy_llm_client(llm, **update)
+
+    def _get_llm_name(self, agent_name: str) -> typing.Optional[str]:
+        """Get the name of the LLM of an agent - its `llm` key, else the crew `llm` key, None for the default LLM."""
+        return self._crew_config['agents'][agent_name].get('llm') or self._crew_config.get('llm')
+
+    def _get_llm(self, agent_name: str):
+        llm_name: typing.Optional[str] = self._get_llm_name(agent_name)
+        if llm_name is None:
+            return self._llm
+        if llm_name not in self._llms:
+            raise ValueError(f'LLM {llm_name} of agent {agent_name} was not loaded')
+        return self._llms[llm_name]
+
+    def _get_current_task_name(self) -> typing.Optional[str]:
+        task_names: list[str] = list(self._crew_config['tasks'])
+        return task_names[len(self._task_outputs)] if len(self._task_outputs) < len(task_names) else None
+
+    def _on_task_output(self, task_output: TaskOutput):
+        """Checkpoint the output of a completed task."""
+        self._task_outputs.append(task_output)
+        if self._stream:
+            self._stream.on_task_output(task_output)
+
+    def _get_remaining_tasks(self) -> list[Task]:
+        """Get the tasks not completed yet in the current run.
+
+        When resuming, the first remaining task gets the checkpointed output of the task before it as context -
+        the same context it gets in an uninterrupted sequential run.
+        """
+        tasks: list[Task] = self._get_crew_tasks()
+        completed: int = len(self._task_outputs)
+        if not completed:
+            return tasks
+        rich.print(
+            f"[yellow bold]Resuming crew <{self._crew_name}> from task <{self._get_current_task_name()}> "
+            f"({completed}/{len(tasks)} tasks completed)[/yellow bold]"
+        )
+        tasks[completed - 1].output = self._task_outputs[-1]
+        tasks[completed].context = [tasks[completed - 1]]
+        return tasks[completed:]
+
     def _get_crew_tasks(self) -> list[Task]:
         return [
             Task(
                 description=self._evaluate_input(task_context['description']),
                 expected_output=self._evaluate_input(task_context['expected_output']),
                 tools=[
-                    get_tool(tool, task_id=self._get_tool_id(task_name))
+                    self._get_tool(tool, scope=task_name)
                     for tool in task_context.get('tools') or []
                 ],
-                agent=self._get_agent(agent_name=task_context['agent'], agent_scope=task_name),
+                agent=self._get_agent(agent_name=task_context['agent']),
             )
             for task_name, task_context in self._crew_config['tasks'].items()
         ]
@@ -157,6 +269,45 @@ class CrewRunner:
             for agent_name, agent_config in list(self._crew_config.get('agents').items()) or []
         ]
 
+    def _get_cache_key(self) -> str:
+        """Hash everything that determines the crew result.
+
+        Covers the rendered agents and tasks (which embed the user inputs, context files and the upstream
+        results they reference), the crew context, the tools, the models configuration and the results
+        of the crews this crew depends on.
+        """
+        agents: dict = {
+            agent_name: {
+                'role': self._evaluate_input(agent_config['role']),
+                'goal': self._evaluate_input(agent_config['goal']),
+                'backstory': self._evaluate_input(agent_config['backstory']),
+                'tools': agent_config.get('tools') or [],
+                'llm': get_client_fingerprint(self._get_llm(agent_name)),
+            }
+            for agent_name, agent_config in self._crew_config['agents'].items()
+        }
+        tasks: list[dict] = [
+            {
+                'name': task_name,
+                'description': self._evaluate_input(task_context['description']),
+                'expected_output': self._evaluate_input(task_context['expected_output']),
+                'agent': task_context['agent'],
+                'tools': task_context.get('tools') or [],
+            }
+            for task_name, task_context in self._crew_config['tasks'].items()
+        ]
+        return CrewResultsCache.make_key({
+            'crew': self._crew_name,
+            'agents': agents,
+            'tasks': tasks,
+            'context': self._crew_context,
+            'embedder': get_client_fingerprint(self._embedding_model),
+            'upstream_results': {
+                dependency: self._previous_results.get(dependency)
+                for dependency in self._crew_config.get('depends_on') or []
+            },
+        })
+
     def _export_results(self, results: str):
         if self._should_export_results:
             export_path: Path = self._get_export_path()
@@ -165,55 +316,93 @@ class CrewRunner:
                 f'Writing {self._crew_name} result into <{export_path}>'
                 f'[/green bold]'
             )
-            if not export_path.parent.exists():
-                export_path.parent.mkdir(parents=True, exist_ok=True)
-            export_path.write_text(results)
+            if self._stream:
+                self._stream.finish(results)
+            else:
+                write_atomically(export_path, results)
         else:
             rich.print(f"[green bold]Crew <{self._crew_name}> result:\n{results}\n\n[/green bold]")
 
     def _get_export_path(self) -> Path:
+        output_directory: Path = Path.cwd() / 'projects' / self._project_name / 'output'
+        if self._output_subdirectory:
+            output_directory = output_directory / self._output_subdirectory
         if not is_safe_path(Path.cwd() / 'projects' / self._project_name / 'output',
-                            Path.cwd() / 'projects' / self._project_name / 'output' / self._output_file):
+                            output_directory / self._output_file):
             rich.print(f"[red bold]Error: Directory traversal detected in output file {self._output_file}[/red bold]")
             os._exit(1)
-        return Path.cwd() / 'projects' / self._project_name / 'output' / self._output_file
+        return output_directory / self._output_file
 
     def run_crew(self) -> str:
-        export_path: Path = self._get_export_path()
-        if not self._ignore_cache and export_path.exists():
-            return export_path.read_text()
+        cache_key: typing.Optional[str] = self._get_cache_key() if self._results_cache else None
+        if cache_key and not self._ignore_cache:
+            cached_results: typing.Optional[str] = self._results_cache.get(cache_key)
+            if cached_results is not None:
+                rich.print(f"[green bold]Using cached result of crew <{self._crew_name}>[/green bold]")
+                self._export_results(cached_results)
+                return cached_results
 
         max_retries = 5
         retry_count = 0
         backoff_factor = 2
+        self._task_outputs = []
 
         while retry_count < max_retries:
             try:
-                results: str = Crew(
-                    agents=self._generate_agents(),
-                    tasks=self._get_crew_tasks(),
-                    verbose=2
-                ).kickoff()
+                if self._stream and not self._task_outputs:
+                    rich.print(f"[green]Streaming {self._crew_name} output into <{self._stream.partial_path}>[/green]")
+                    self._stream.start()
+                if len(self._task_outputs) == len(self._crew_config['tasks']):
+                    # all the tasks completed before the error
+                    results: str = self._task_outputs[-1].raw_output
+                else:
+                    results: str = Crew(
+                        agents=self._generate_agents(),
+                        tasks=self._get_remaining_tasks(),
+                        verbose=2,
+                        task_callback=self._on_task_output,
+                    ).kickoff()
+                if self._stream and self._stream.time_to_first_output is not None:
+                    rich.print(f"[green]Crew <{self._crew_name}> first output after {self._stream.time_to_first_output:.1f}s[/green]")
                 self._export_results(results)
+                if cache_key:
+                    self._results_cache.set(cache_key, results)
                 return results
 
             except Exception as e:
                 error_code = self._extract_error_code(e)  # Implement this method to extract the error code
                 if error_code == "429":  # Check for rate limit error code
                     retry_count += 1
-                    wait_time = backoff_factor ** retry_count
+                    wait_time = get_retry_after(e) or backoff_factor ** retry_count
                     rich.print(f"[yellow bold]Rate limit error encountered. Retrying in {wait_time} seconds...[/yellow bold]")
                     rich.print(f"[yellow bold]Exception details: {e}[/yellow bold]")
+                    rate_limiters: list = list(filter(None, {
+                        id(limiter): limiter
+                        for limiter in map(get_client_rate_limiter, map(self._get_llm, self._crew_config['agents']))
+                    }.values()))
+                    if rate_limiters:
+                        # hold every client of the providers, not only this crew - the retry waits in the limiters
+                        for rate_limiter in rate_limiters:
+                            rate_limiter.pause(wait_time)
+                    else:
+                        time.sleep(wait_time)
+                elif error_code in TRANSIENT_ERROR_CODES:
+                    retry_count += 1
+                    wait_time = backoff_factor ** retry_count
+                    rich.print(f"[yellow bold]Transient error encountered. Retrying in {wait_time} seconds...[/yellow bold]")
+                    rich.print(f"[yellow bold]Exception details: {e}[/yellow bold]")
                     time.sleep(wait_time)
                 else:
                     rich.print(f"[red bold]Error occurred while running crew <{self._crew_name}>[/red bold]")
                     rich.print(f"[red bold]Error: {e}[/red bold]")
                     if EXIT_ON_ERROR:
                         os._exit(1)
+                    self.failed = True
                     return str(e)
 
         rich.print(f"[red bold]Exceeded maximum retries. Aborting...[/red bold]")
-        return "Rate limit error: Exceeded maximum retries"
+        self.failed = True
+        return "Rate limit or transient error: Exceeded maximum retries"
 
     def _extract_error_code(self, exception: Exception) -> str:
         # Example implementation - adjust based on your actual exception structure
@@ -1,6 +1,28 @@
 import networkx as nx
 
 
+def get_crews_graph(execution_config: dict) -> nx.DiGraph:
+    """Build the dependency graph of the crews by the 'depends_on' key.
+
+    Each edge points from a crew to a crew that depends on it.
+    Raise `nx.NetworkXUnfeasible` if the resulted graph is not a Directed Acyclic Graph (DAG).
+    """
+    G = nx.DiGraph()
+    crews = execution_config['crews']
+
+    for crew in crews:
+        G.add_node(crew)
+
+    for crew, crew_config in crews.items():
+        for dependency in crew_config.get('depends_on') or []:
+            G.add_edge(dependency, crew)  # Directed edge: dependency -> crew
+
+    if not nx.is_directed_acyclic_graph(G):
+        raise nx.NetworkXUnfeasible("The graph is not a Directed Acyclic Graph (DAG).")
+
+    return G
+
+
 def get_crews_execution_order(execution_config: dict) -> list[str]:
     """Get the order of execution of the crews by the 'depends_on' key.
 
@@ -22,19 +44,11 @@ def get_crews_execution_order(execution_config: dict) -> list[str]:
     Run the crew only if the crews it depends on have been executed.
     Check that the resulted graph is Directed Acyclic Graph (DAG).
     """
-    G = nx.DiGraph()
-    crews = execution_config['crews']
+    execution_order = list(nx.topological_sort(get_crews_graph(execution_config)))
 
-    for crew in crews:
-        G.add_node(crew)
-
-    for crew, crew_config in crews.items():
-        for dependency in crew_config.get('depends_on') or []:
-            G.add_edge(dependency, crew)  # Directed edge: dependency -> crew
-
-    if not nx.is_directed_acyclic_graph(G):
-        raise nx.NetworkXUnfeasible("The graph is not a Directed Acyclic Graph (DAG).")
+    return execution_order
 
-    execution_order = list(nx.topological_sort(G))
 
-    return execution_order
+def get_downstream_crews(crews_graph: nx.DiGraph, crew: str) -> set[str]:
+    """Get the crew and all the crews that depend on it, directly or transitively."""
+    return nx.descendants(crews_graph, crew) | {crew}
@@ -0,0 +1,195 @@
+import json
+import threading
+import time
+import typing
+from pathlib import Path
+from uuid import UUID
+
+import rich
+import rich.table
+from langchain_core.callbacks import BaseCallbackHandler
+
+from llms.tokens import estimate_tokens, get_token_usage
+
+LEDGER_DIRECTORY_NAME = '.ledgers'
+
+
+class UsageLedger:
+    """Per-run record of the LLM calls - tokens, latency and estimated cost - and of the crews wall-clock.
+
+    Entries are tagged with project, crew, task and agent, and appended to a JSONL file as they are recorded.
+    Costs are estimated from the optional `pricing` of the LLM config (`config/llms/<name>.json`):
+        "pricing": {"prompt_per_1k_tokens": 0.005, "completion_per_1k_tokens": 0.015}
+    Safe to share between threads.
+    """
+
+    def __init__(self, path: Path, project_name: str, pricing: typing.Optional[dict] = None,
+                 llms_pricing: typing.Optional[dict[str, typing.Optional[dict]]] = None):
+        self.path: Path = path
+        self._project_name: str = project_name
+        self._pricing: dict = pricing or {}
+        # pricing of the LLMs routed to by name (the `llm` key of crews and agents)
+        self._llms_pricing: dict[str, typing.Optional[dict]] = llms_pricing or {}
+        self._entries: list[dict] = []
+        self._lock = threading.Lock()
+
+    def get_callback_handler(self, crew_name: str, agent_name: str,
+                             get_task_name: typing.Callable[[], typing.Optional[str]],
+                             llm_name: typing.Optional[str] = None) -> 'LedgerCallbackHandler':
+        """Get a callback handler recording the LLM calls of an agent (see the LLM client `callbacks`).
+
+        `llm_name` is the LLM the agent is routed to, None for the default LLM.
+        """
+        return LedgerCallbackHandler(self, crew_name=crew_name, agent_name=agent_name, get_task_name=get_task_name,
+                                     llm_name=llm_name)
+
+    def record_llm_call(self, crew_name: str, task_name: typing.Optional[str], agent_name: str,
+                        model: typing.Optional[str], prompt_tokens: int, completion_tokens: int,
+                        latency: float, estimated_tokens: bool = False, cached: bool = False,
+                        error: typing.Optional[str] = None, llm_name: typing.Optional[str] = None):
+        self._record({
+            'type': 'llm_call',
+            'crew': crew_name,
+            'task': task_name,
+            'agent': agent_name,
+            'llm': llm_name,
+            'model': model,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'estimated_tokens': estimated_tokens,
+            'latency': round(latency, 3),
+            'cached': cached,
+            'cost': 0.0 if cached else self._get_cost(prompt_tokens, completion_tokens, llm_name),
+            'error': error,
+        })
+
+    def record_crew(self, crew_name: str, duration: float, failed: bool = False):
+        self._record({'type': 'crew', 'crew': crew_name, 'duration': round(duration, 3), 'failed': failed})
+
+    def print_summary(self):
+        """Print the usage of each crew, and the total of the run."""
+        with self._lock:
+            entries: list[dict] = list(self._entries)
+        if not entries:
+            return
+
+        table = rich.table.Table(title=f'LLM usage of {self._project_name}')
+        for column in ('Crew', 'Calls', 'Prompt tokens', 'Completion tokens', 'LLM time (s)', 'Wall-clock (s)', 'Cost'):
+            table.add_column(column, justify='left' if column == 'Crew' else 'right')
+
+        crews: dict[str, dict] = {}
+        for entry in entries:
+            crew: dict = crews.setdefault(entry['crew'], {
+                'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'latency': 0.0, 'duration': 0.0, 'cost': None,
+            })
+            if entry['type'] == 'crew':
+                crew['duration'] += entry['duration']
+                continue
+            crew['calls'] += 1
+            crew['prompt_tokens'] += entry['prompt_tokens']
+            crew['completion_tokens'] += entry['completion_tokens']
+            crew['latency'] += entry['latency']
+            if entry['cost'] is not None:
+                crew['cost'] = (crew['cost'] or 0.0) + entry['cost']
+
+        total: dict = {key: sum(crew[key] for crew in crews.values())
+                       for key in ('calls', 'prompt_tokens', 'completion_tokens', 'latency', 'duration')}
+        costs: list[float] = [crew['cost'] for crew in crews.values() if crew['cost'] is not None]
+        total['cost'] = sum(costs) if costs else None
+        for name, usage in [*crews.items(), ('Total', total)]:
+            table.add_row(
+                name,
+                str(usage['calls']),
+                str(usage['prompt_tokens']),
+                str(usage['completion_tokens']),
+                f"{usage['latency']:.1f}",
+                f"{usage['duration']:.1f}",
+                f"${usage['cost']:.4f}" if usage['cost'] is not None else '-',
+                end_section=name == list(crews)[-1],
+            )
+        rich.print(table)
+        rich.print(f"[grey]LLM usage ledger written into <{self.path}>[/grey]")
+
+    def _get_cost(self, prompt_tokens: int, completion_tokens: int,
+                  llm_name: typing.Optional[str] = None) -> typing.Optional[float]:
+        pricing: typing.Optional[dict] = self._llms_pricing.get(llm_name) if llm_name else self._pricing
+        if not pricing:
+            return None
+        return round(
+            prompt_tokens / 1000 * pricing.get('prompt_per_1k_tokens', 0.0) +
+            completion_tokens / 1000 * pricing.get('completion_per_1k_tokens', 0.0),
+            6,
+        )
+
+    def _record(self, entry: dict):
+        entry = {'time': time.time(), 'project': self._project_name, **entry}
+        with self._lock:
+            self._entries.append(entry)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'a') as file:
+                file.write(json.dumps(entry) + '\n')
+
+
+class LedgerCallbackHandler(BaseCallbackHandler):
+    """Record the LLM calls of one agent of a crew into a `UsageLedger`."""
+
+    def __init__(self, ledger: UsageLedger, crew_name: str, agent_name: str,
+                 get_task_name: typing.Callable[[], typing.Optional[str]], llm_name: typing.Optional[str] = None):
+        self._ledger: UsageLedger = ledger
+        self._llm_name: typing.Optional[str] = llm_name
+        self._crew_name: str = crew_name
+        self._agent_name: str = agent_name
+        self._get_task_name = get_task_name
+        # run id -> (start time, prompt text, requested model), for the calls in progress
+        self._calls: dict[UUID, tuple[float, str, typing.Optional[str]]] = {}
+
+    def on_llm_start(self, serialized: dict, prompts: list[str], *, run_id: UUID, **kwargs: typing.Any):
+        self._calls[run_id] = (time.monotonic(), '\n'.join(prompts), self._get_requested_model(kwargs))
+
+    def on_chat_model_start(self, serialized: dict, messages: list, *, run_id: UUID, **kwargs: typing.Any):
+        prompt: str = '\n'.join(str(message.content) for batch in messages for message in batch)
+        self._calls[run_id] = (time.monotonic(), prompt, self._get_requested_model(kwargs))
+
+    @staticmethod
+    def _get_requested_model(kwargs: dict) -> typing.Optional[str]:
+        # streamed responses have no `llm_output`, the model is taken from the request instead
+        invocation_params: dict = kwargs.get('invocation_params') or {}
+        return invocation_params.get('model_name') or invocation_params.get('model')
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: typing.Any):
+        started_at, prompt, requested_model = self._calls.pop(run_id, (time.monotonic(), '', None))
+        llm_output: dict = response.llm_output or {}
+        prompt_tokens, completion_tokens = get_token_usage(llm_output)
+        estimated: bool = prompt_tokens is None
+        cached: bool = any((generation.generation_info or {}).get('from_cache')
+                           for generations in response.generations for generation in generations)
+        if estimated:
+            completion: str = ''.join(generation.text for generations in response.generations for generation in generations)
+            prompt_tokens, completion_tokens = estimate_tokens(prompt), estimate_tokens(completion)
+        self._ledger.record_llm_call(
+            crew_name=self._crew_name,
+            task_name=self._get_task_name(),
+            agent_name=self._agent_name,
+            llm_name=self._llm_name,
+            model=llm_output.get('model_name') or llm_output.get('model') or requested_model,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens or 0,
+            latency=time.monotonic() - started_at,
+            estimated_tokens=estimated,
+            cached=cached,
+        )
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: typing.Any):
+        started_at, prompt, requested_model = self._calls.pop(run_id, (time.monotonic(), '', None))
+        self._ledger.record_llm_call(
+            crew_name=self._crew_name,
+            task_name=self._get_task_name(),
+            agent_name=self._agent_name,
+            llm_name=self._llm_name,
+            model=requested_model,
+            prompt_tokens=estimate_tokens(prompt),
+            completion_tokens=0,
+            latency=time.monotonic() - started_at,
+            estimated_tokens=True,
+            error=str(error),
+        )
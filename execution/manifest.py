@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import re
+import string
+import tempfile
+import threading
+import typing
+from pathlib import Path
+
+import networkx as nx
+
+from execution.contexts import CONTEXT_DIRECTORY_PATH
+
+MANIFEST_FILE_NAME = '.crews-manifest.json'
+
+
+def _hash(value: str) -> str:
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+def get_template_variables(template: str) -> set[str]:
+    """Get the names of the variables referenced by a crew template (e.g. `{pr_number}`, `{sha256:pr_number}`)."""
+    template = re.sub(r'\{sha256:(\w+)\}', r'{\1}', template or '')
+    try:
+        return {
+            field_name
+            for _, field_name, _, _ in string.Formatter().parse(template)
+            if field_name
+        }
+    except ValueError:
+        return set()
+
+
+def get_crew_variables(crew_config: dict) -> set[str]:
+    """Get the names of all the variables referenced by the templates of a crew."""
+    templates: list[str] = [
+        crew_config.get('output_naming_template') or '',
+        crew_config.get('validate_results') or '',
+        *(crew_config.get('context') or {}).values(),
+    ]
+    for agent_config in (crew_config.get('agents') or {}).values():
+        templates += [agent_config.get('role') or '', agent_config.get('goal') or '', agent_config.get('backstory') or '']
+    for task_config in (crew_config.get('tasks') or {}).values():
+        templates += [task_config.get('description') or '', task_config.get('expected_output') or '']
+
+    variables: set[str] = set()
+    for template in templates:
+        variables |= get_template_variables(template)
+    return variables
+
+
+def get_crew_consumption(project_name: str, crew_config: dict, user_inputs: dict, crews_names: typing.Iterable[str]) -> dict:
+    """Describe what a crew consumes: its configuration, user inputs, context files and upstream crews.
+
+    Values are recorded as hashes, so the description can be compared between runs.
+    """
+    variables: set[str] = get_crew_variables(crew_config)
+    context_files: dict[str, typing.Optional[str]] = {}
+    for context_file in (crew_config.get('context') or {}).values():
+        try:
+            context_file = context_file.format(**user_inputs)
+            content: str = (Path.cwd() / 'projects' / project_name / CONTEXT_DIRECTORY_PATH / context_file).read_text()
+            context_files[context_file] = _hash(content)
+        except (KeyError, ValueError, OSError):
+            # unresolvable or missing - never equal to a recorded hash
+            context_files[context_file] = None
+
+    return {
+        'config': _hash(json.dumps(crew_config, sort_keys=True, default=str)),
+        'user_inputs': {name: _hash(str(user_inputs[name])) for name in sorted(variables & set(user_inputs))},
+        'context_files': context_files,
+        'upstream_crews': sorted(set(crew_config.get('depends_on') or []) | (variables & set(crews_names))),
+    }
+
+
+class ExecutionManifest:
+    """Record of what each crew consumed and produced in previous runs of a project.
+
+    Stored as JSON next to the crews outputs. Used to find the crews invalidated by a change
+    of configuration, user input, context file or upstream result.
+    """
+
+    def __init__(self, path: Path):
+        self._path: Path = path
+        self._lock = threading.Lock()
+        try:
+            self._records: dict[str, dict] = json.loads(path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._records = {}
+
+    def get_invalidated_crews(self, crews_graph: nx.DiGraph, consumptions: dict[str, dict]) -> dict[str, str]:
+        """Get the crews invalidated since they were recorded, with the reason for each.
+
+        A crew is invalidated when something it consumed changed since it was recorded, or when an
+        upstream crew it consumes is invalidated. Crews that were never recorded are not reported.
+        """
+        invalidated: dict[str, str] = {}
+        for crew in nx.topological_sort(crews_graph):
+            record: typing.Optional[dict] = self._records.get(crew)
+            if record is None:
+                continue
+            consumption: dict = consumptions[crew]
+            changes: list[str] = []
+            if record['config'] != consumption['config']:
+                changes.append('crew configuration')
+            for kind, label in (('user_inputs', 'user input'), ('context_files', 'context file')):
+                for name in sorted(set(record[kind]) | set(consumption[kind])):
+                    if record[kind].get(name) is None or record[kind].get(name) != consumption[kind].get(name):
+                        changes.append(f'{label} <{name}>')
+            for upstream in consumption['upstream_crews']:
+                if upstream in invalidated:
+                    changes.append(f'upstream crew <{upstream}>')
+                elif record['upstream_results'].get(upstream) != (self._records.get(upstream) or {}).get('result'):
+                    changes.append(f'result of upstream crew <{upstream}>')
+            if changes:
+                invalidated[crew] = f'changed {", ".join(changes)}'
+        return invalidated
+
+    def record(self, crew_name: str, consumption: dict, previous_results: dict, result: str):
+        """Record what a crew consumed and the result it produced, and persist the manifest."""
+        with self._lock:
+            self._records[crew_name] = {
+                **consumption,
+                'upstream_results': {
+                    upstream: _hash(previous_results[upstream])
+                    for upstream in consumption['upstream_crews']
+                    if upstream in previous_results
+                },
+                'result': _hash(result),
+            }
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=self._path.parent, suffix='.tmp')
+            with os.fdopen(fd, 'w') as file:
+                json.dump(self._records, file, indent=2, sort_keys=True)
+            os.replace(temp_path, self._path)
@@ -3,21 +3,53 @@ from pathlib import Path
 import rich
 import yaml
 
+from execution.cache import CrewResultsCache
 from execution.consts import EXECUTION_CONFIG_PATH
 from execution.crews.builder import CrewRunner
-from execution.graph import get_crews_execution_order
-from utils import get_clients
+from execution.graph import get_crews_execution_order, get_crews_graph, get_downstream_crews
+from execution.ledger import LEDGER_DIRECTORY_NAME, UsageLedger
+from execution.manifest import MANIFEST_FILE_NAME, ExecutionManifest, get_crew_consumption
+from execution.results import CrewResultsStore
+from execution.scheduler import run_crews_graph
+from execution.validation import ValidationQueue, get_validation_item, get_validation_queue
+from llms.aio import get_async_llm_client
+from llms.rate_limiter import get_rate_limiters
+from tools.index import validate_tools_env_vars
+from utils import get_clients, get_llm_config, get_named_llm_client
 from utils import sanitize_filename
 from utils import is_safe_path
 import os
+import time
+import typing
 from utils import validate_env_vars
 validate_env_vars('LLM_NAME', 'EMBEDDER_NAME')
 
 def execute_crews(project_name: str,
                   user_inputs: dict = None,
                   validations: dict = None,
-                  ignore_cache: bool = False):
-    """Execute crews in the order defined in the execution config."""
+                  ignore_cache: bool = False,
+                  max_parallel_crews: int = 1,
+                  execution_id: str = None,
+                  results_cache: CrewResultsCache = None,
+                  rerun_from: str = None,
+                  stream_output: bool = False):
+    """Execute crews in the order defined in the execution config.
+
+    Independent crews run concurrently, up to `max_parallel_crews` at a time.
+    When `execution_id` is given (benchmark executions), the crews outputs and the validation
+    results are written to paths of their own, so concurrent executions don't overwrite each other.
+    Validations run in the background, batched with the validations of other executions - call
+    `execution.validation.wait_for_validations` before reading their results.
+    Crews whose inputs didn't change since a previous run reuse their result from `results_cache`,
+    unless `ignore_cache` is set.
+    What each crew consumed (configuration, user inputs, context files and upstream crews) is recorded
+    in a manifest, and the crews invalidated since the previous run are reported. The results cache key
+    covers the same inputs, so only those crews and their downstream crews are rerun.
+    `rerun_from` and its downstream crews are always rerun.
+    The LLM calls of the crews (tokens, latency and estimated cost) and the crews wall-clock are recorded
+    into a JSONL ledger under `output/.ledgers/`, and summarized at the end of the execution.
+    With `stream_output`, the crews outputs are streamed into `<output file>.partial` while they are generated.
+    """
     if not user_inputs:
         user_inputs = {}
 
@@ -28,10 +60,16 @@ def execute_crews(project_name: str,
         os._exit(1)
 
     execution_config: dict = get_execution_config(project_name)
+    validate_tools_env_vars(get_project_tools(execution_config))
     llm_name: str = os.getenv('LLM_NAME')
     embedder_name: str = os.getenv('EMBEDDER_NAME')
-    llm, embedding_model = get_clients(llm_name, embedder_name)
+    llm, embedding_model = get_clients(llm_name, embedder_name, namespace=project_name)
+    # LLMs routed to by the `llm` key of crews and agents
+    llms: dict = {name: get_named_llm_client(name, namespace=project_name) for name in get_project_llms(execution_config)}
+    crews_graph = get_crews_graph(execution_config)
     execution_order: list[str] = get_crews_execution_order(execution_config)
+    if rerun_from and rerun_from not in execution_order:
+        raise ValueError(f'Crew <{rerun_from}> not found in project {project_name}')
 
     rich.print(
         f'[bold white]'
@@ -39,126 +77,109 @@ def execute_crews(project_name: str,
         f'[/bold white]'
     )
 
-    crews_results: dict = {}
-    for acting_crew in execution_order:
+    output_directory: Path = Path.cwd() / 'projects' / project_name / 'output'
+    manifest = ExecutionManifest(output_directory / (execution_id or '') / MANIFEST_FILE_NAME)
+    consumptions: dict[str, dict] = {
+        crew: get_crew_consumption(project_name, execution_config['crews'][crew], user_inputs, execution_order)
+        for crew in execution_order
+    }
+    for crew, reason in manifest.get_invalidated_crews(crews_graph, consumptions).items():
+        rich.print(f"[yellow]Crew <{crew}> is invalidated since the previous run: {reason}[/yellow]")
+    ledger = UsageLedger(
+        path=output_directory / (execution_id or '') / LEDGER_DIRECTORY_NAME / f'{time.strftime("%Y%m%d-%H%M%S")}.jsonl',
+        project_name=project_name,
+        pricing=get_llm_config(llm_name).get('pricing'),
+        llms_pricing={name: get_llm_config(name).get('pricing') for name in llms},
+    )
+    validation_queue: typing.Optional[ValidationQueue] = get_validation_queue(
+        get_async_llm_client(get_llm_config(llm_name), namespace=project_name)
+    ) if validations else None
+    rerun_crews: set[str] = get_downstream_crews(crews_graph, rerun_from) if rerun_from else set()
+    if rerun_crews:
+        rich.print(f"[yellow]Rerunning crews: {[crew for crew in execution_order if crew in rerun_crews]}[/yellow]")
+
+    def run_crew(acting_crew: str, previous_crews_results: CrewResultsStore) -> str:
         crew_config: dict = execution_config['crews'][acting_crew]
         rich.print(f"[white bold]Running crew <{acting_crew}> [/white bold]")
-        result: str = CrewRunner(
+        crew_runner = CrewRunner(
             project_name=project_name,
             crew_name=acting_crew,
             crew_config=crew_config,
             user_inputs=user_inputs,
-            previous_crews_results=crews_results,
+            previous_crews_results=previous_crews_results,
             llm=llm,
             embedding_model=embedding_model,
             should_export_results=(execution_config.get('settings') or {}).get('output_results'),
-            ignore_cache=ignore_cache,
-        ).run_crew()
-        crews_results[acting_crew] = result
+            ignore_cache=ignore_cache or acting_crew in rerun_crews,
+            output_subdirectory=execution_id,
+            results_cache=results_cache,
+            stream_output=stream_output,
+            ledger=ledger,
+            llms=llms,
+        )
+        started_at: float = time.monotonic()
+        result: str = crew_runner.run_crew()
+        ledger.record_crew(acting_crew, time.monotonic() - started_at, failed=crew_runner.failed)
+        if not crew_runner.failed:
+            manifest.record(acting_crew, consumptions[acting_crew], previous_crews_results, result)
         if validations and acting_crew in validations:
-            from crewai import Task, Agent, Crew
-            import textwrap
-            validations_compare_to = validations[acting_crew]['compare_to']
-            compare_to_filename: Path = (
-                Path.cwd()
-                / 'projects'
-                / project_name
-                / 'validations'
-                / validations_compare_to
-            )
-            if compare_to_filename.exists():
-                if is_safe_path(Path.cwd() / 'projects' / project_name, compare_to_filename):
-                    with open(compare_to_filename, 'r') as file:
-                        # validations_compare_to is a filename, overwrite var with its content to be used below
-                        validations_compare_to = file.read()
-                    validation_results_filename: Path = Path(f'{compare_to_filename}.result') # no need to sanitize filename or check path traversal as just adding an extension to validated path.
-                else:
-                    rich.print(
-                        f"[bold red]Error: Path traversal detected in {compare_to_filename}[/bold red]"
-                    )
-                    os._exit(1)
-            else:
-                input_values_filename = f'{sanitize_filename("_".join(user_inputs.values()))}.result'
-                validation_results_filename: Path = Path(
-                    Path.cwd()
-                    / 'projects'
-                    / project_name
-                    / 'validations'
-                    / input_values_filename
-                )
-                if not is_safe_path(Path.cwd() / 'projects' / project_name, validation_results_filename):
-                    rich.print(
-                        f"[bold red]Error: Path traversal detected in {validation_results_filename}[/bold red]"
-                    )
-                    os._exit(1)
-            
-            metrics = validations[acting_crew]['metrics']
-
-            agent = Agent(
-                role = 'Software QA Engineer',
-                goal = 'Validate the results of the crew',
-                backstory = """You are a Software QA Engineer who is responsible for validating the results of the crew.""",
-                tools = [],
-                llm = llm,
+            # validated in the background, the next crews don't wait for the judge
+            validation_queue.submit(get_validation_item(
+                project_name=project_name,
+                crew_name=acting_crew,
+                result=result,
+                validations=validations,
+                user_inputs=user_inputs,
+                execution_id=execution_id,
+            ))
+        return result
+
+    # keep each result in memory only until the last crew consuming it has finished
+    crews_results = CrewResultsStore(consumers={
+        crew: {consumer for consumer in execution_order if crew in consumptions[consumer]['upstream_crews']}
+        for crew in execution_order
+    })
+    try:
+        run_crews_graph(crews_graph, run_crew, max_parallel_crews=max_parallel_crews, crews_results=crews_results)
+    finally:
+        crews_results.close()
+        ledger.print_summary()
+        for provider, rate_limiter in get_rate_limiters().items():
+            metrics: dict = rate_limiter.metrics
+            rich.print(
+                f"[grey]Rate limiter <{provider}>: {metrics['waits']}/{metrics['requests']} requests waited, "
+                f"{metrics['wait_seconds']:.1f}s in total (max {metrics['max_wait_seconds']:.1f}s), "
+                f"{metrics['pauses']} Retry-After pauses[/grey]"
             )
-            task =Task(
-                description = textwrap.dedent(f"""\
-                    IMPORTANT INSTRUCTIONS:
-                    -----------------------
-                    - output MUST be in json format without any additional text (output is used by other tools - !!!NOT ENCLOSED IN JSON CODE BLOCK!!!).
-                    - output MUST contain a boolean result for each check.
-                    - output MUST NOT include any text other than the json object!!
-
-                    for each of the following checks:
-                    <<<<METRICS_START_MARKER>>>>
-                    {metrics}
-                    <<<<METRICS_END_MARKER>>>>
-                    compare the result with the expected output and indicate for each check if it succeeded or not.
-
-                    <<<<RESULT_START_MARKER>>>>
-                    {result}
-                    <<<<RESULT_END_MARKER>>>>
-
-                    <<<<EXPECTED_OUTPUT_START_MARKER>>>>
-                    {validations_compare_to}
-                    <<<<EXPECTED_OUTPUT_END_MARKER>>>>
-                """),
-                expected_output = textwrap.dedent(
-                    f"""direct json string (not enclosed in json code-block) with the following structure (
-                        failure requires reason, success does not):
-                        -----------------------
-                        {{check_endpoint: {{res: false, reason: "the version of the API endpoint URL. The result uses `/v3/admin/users/` while the expected output uses `/v2/admin/users/`"}}, check_something_else: {{res: false, reason: 'succinct reason for failue'}}, check_another_thing: {{res: true}}...}}
-                        -----------------------
-                        
-                        IMPORTANT INSTRUCTIONS:
-                        -----------------------
-                        - Your response MUST be in json format without any additional text (output is used by other tools - !!!NOT ENCLOSED IN JSON CODE BLOCK!!!).
-                        - Example response is the text above enclosed between horizontal lines (without the lines).
-                        - Ensure the output is a direct json string (not enclosed in json code-block).
-                        - Ensure there is no text before or after the json object.
-                        - You MUST provide comparison reason for each failed check - i.e., what is the difference between the actual and expected output for the specific check.
-                        - Reason MUST be succinct and clear.
-                        """),
-                tools = [],
-                agent = agent,
+        # imported here - importing the GitHub client module sets up PyGithub for the whole process
+        from tools.github_client import get_github_cache_metrics
+        github_cache_metrics: typing.Optional[dict] = get_github_cache_metrics()
+        if github_cache_metrics:
+            rich.print(
+                f"[grey]GitHub cache: {github_cache_metrics['hits']}/{github_cache_metrics['requests']} requests "
+                f"not modified ({github_cache_metrics['hit_rate']:.0%} hit rate), "
+                f"{github_cache_metrics['stored']} responses stored[/grey]"
             )
-            crew = Crew(
-                agents = [agent],
-                tasks = [task],
-                verbose = 2,
-            )
-            validation_result = crew.kickoff()
-            if not validation_results_filename.parent.exists():
-                validation_results_filename.parent.mkdir(parents=True)
-
-            if not is_safe_path(Path.cwd() / 'projects' / project_name, validation_results_filename):
-                rich.print(
-                    f"[bold red]Error: Path traversal detected in {validation_results_filename}[/bold red]"
-                )
-                os._exit(1)
-
-            with open(validation_results_filename, 'w') as file:
-                file.write(validation_result)
+
+
+def get_project_llms(execution_config: dict) -> set[str]:
+    """Get the names of the LLMs set by the `llm` key of the crews and agents of the project."""
+    return {
+        config['llm']
+        for crew_config in execution_config['crews'].values()
+        for config in [crew_config, *(crew_config.get('agents') or {}).values()]
+        if config.get('llm')
+    }
+
+
+def get_project_tools(execution_config: dict) -> set[str]:
+    """Get the names of all the tools used by the agents and tasks of the project."""
+    return {
+        tool
+        for crew_config in execution_config['crews'].values()
+        for config in [*(crew_config.get('agents') or {}).values(), *(crew_config.get('tasks') or {}).values()]
+        for tool in config.get('tools') or []
+    }
 
 
 def get_execution_config(project_name: str) -> dict:
@@ -0,0 +1,82 @@
+import collections.abc
+import shutil
+import tempfile
+import threading
+import typing
+from pathlib import Path
+
+
+class CrewResultsStore(collections.abc.MutableMapping):
+    """Results of the crews of an execution, by crew name.
+
+    A result is kept in memory only while crews that consume it (see `consumers`) are still to finish.
+    Once its last consumer has a result of its own, the result is spilled to a temporary file and
+    loaded back lazily if anything asks for it again. Safe to share between threads.
+    """
+
+    def __init__(self, consumers: dict[str, set[str]]):
+        # crew -> crews that consume its result and haven't finished yet
+        self._pending_consumers: dict[str, set[str]] = {crew: set(crews) for crew, crews in consumers.items()}
+        self._in_memory: dict[str, str] = {}
+        self._spilled: dict[str, Path] = {}
+        self._spill_directory: typing.Optional[Path] = None
+        self._spill_count: int = 0
+        self._lock = threading.Lock()
+
+    def __getitem__(self, crew: str) -> str:
+        with self._lock:
+            if crew in self._in_memory:
+                return self._in_memory[crew]
+            if crew in self._spilled:
+                return self._spilled[crew].read_text()
+        raise KeyError(crew)
+
+    def __setitem__(self, crew: str, result: str):
+        """Store the result of a crew - the crew has finished consuming the results of its upstream crews."""
+        with self._lock:
+            self._in_memory[crew] = result
+            self._spilled.pop(crew, None)
+            for upstream, pending_consumers in self._pending_consumers.items():
+                if crew in pending_consumers:
+                    pending_consumers.discard(crew)
+                    if not pending_consumers:
+                        self._spill(upstream)
+            if not self._pending_consumers.get(crew):
+                self._spill(crew)
+
+    def __delitem__(self, crew: str):
+        with self._lock:
+            if crew not in self._in_memory and crew not in self._spilled:
+                raise KeyError(crew)
+            self._in_memory.pop(crew, None)
+            spilled_path: typing.Optional[Path] = self._spilled.pop(crew, None)
+            if spilled_path:
+                spilled_path.unlink(missing_ok=True)
+
+    def __iter__(self) -> typing.Iterator[str]:
+        with self._lock:
+            return iter([*self._in_memory, *self._spilled])
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._in_memory) + len(self._spilled)
+
+    def close(self):
+        """Drop all the results and remove the spilled files."""
+        with self._lock:
+            self._in_memory.clear()
+            self._spilled.clear()
+            if self._spill_directory:
+                shutil.rmtree(self._spill_directory, ignore_errors=True)
+                self._spill_directory = None
+
+    def _spill(self, crew: str):
+        """Move the result of a crew from memory to disk. Must be called with the lock held."""
+        if crew not in self._in_memory:
+            return
+        if self._spill_directory is None:
+            self._spill_directory = Path(tempfile.mkdtemp(prefix='crews-results-'))
+        self._spill_count += 1
+        path: Path = self._spill_directory / f'{self._spill_count}.result'
+        path.write_text(self._in_memory.pop(crew))
+        self._spilled[crew] = path
@@ -0,0 +1,53 @@
+import typing
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+import networkx as nx
+
+
+def run_crews_graph(
+    crews_graph: nx.DiGraph,
+    run_crew: typing.Callable[[str, typing.Mapping[str, str]], str],
+    max_parallel_crews: int = 1,
+    crews_results: typing.Optional[typing.MutableMapping[str, str]] = None,
+) -> typing.MutableMapping[str, str]:
+    """Run the crews of the graph, each one as soon as all the crews it depends on have finished.
+
+    `run_crew` is called with the crew name and the results of the crews that finished so far
+    (`crews_results`, a plain dict unless given).
+    At most `max_parallel_crews` crews run at the same time. With a single worker the crews run
+    one after another in topological order, exactly like the sequential execution.
+
+    Returns the result of each crew by its name.
+    """
+    execution_order: list[str] = list(nx.topological_sort(crews_graph))
+    pending_dependencies: dict[str, set[str]] = {
+        crew: set(crews_graph.predecessors(crew)) for crew in execution_order
+    }
+    if crews_results is None:
+        crews_results = {}
+
+    max_workers: int = max(1, max_parallel_crews)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        waiting: list[str] = list(execution_order)
+        running: dict[Future, str] = {}
+        try:
+            while waiting or running:
+                # submit only when a worker is free, so each crew sees the freshest results
+                ready: list[str] = [crew for crew in waiting if not pending_dependencies[crew]]
+                for crew in ready[:max_workers - len(running)]:
+                    waiting.remove(crew)
+                    running[executor.submit(run_crew, crew, crews_results)] = crew
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                # keep the topological order between crews that finished together
+                for future in sorted(done, key=lambda f: execution_order.index(running[f])):
+                    finished_crew: str = running.pop(future)
+                    crews_results[finished_crew] = future.result()
+                    for dependant in crews_graph.successors(finished_crew):
+                        pending_dependencies[dependant].discard(finished_crew)
+        except BaseException:
+            for future in running:
+                future.cancel()
+            raise
+
+    return crews_results
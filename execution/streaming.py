@@ -0,0 +1,77 @@
+import os
+import tempfile
+import threading
+import time
+import typing
+from pathlib import Path
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+PARTIAL_FILE_SUFFIX = '.partial'
+
+
+def write_atomically(path: Path, content: str):
+    """Write a file so readers see either its previous content or the new one, never a partial write."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as file:
+            file.write(content)
+        os.replace(temp_path, path)
+    except BaseException:
+        Path(temp_path).unlink(missing_ok=True)
+        raise
+
+
+class StreamingExport(BaseCallbackHandler):
+    """Stream the output of a crew into `<export path>.partial` while the crew runs.
+
+    LLM tokens (when the LLM streams) and the output of each finished task are appended as they are
+    generated, so the progress can be followed with `tail -f` and a crash keeps what was generated so far.
+    `finish` writes the final result into the export path atomically and removes the partial file.
+    Attach it to the LLM clients of the crew agents (`callbacks`, with `streaming` on) for the tokens, and to the crew
+    `task_callback` for the tasks outputs.
+    """
+
+    def __init__(self, export_path: Path):
+        self.export_path: Path = export_path
+        self.partial_path: Path = export_path.with_name(export_path.name + PARTIAL_FILE_SUFFIX)
+        self._lock = threading.Lock()
+        self._started_at: typing.Optional[float] = None
+        self._first_output_at: typing.Optional[float] = None
+
+    @property
+    def time_to_first_output(self) -> typing.Optional[float]:
+        """Seconds from `start` until the first token or task output, None if nothing was generated yet."""
+        if self._started_at is None or self._first_output_at is None:
+            return None
+        return self._first_output_at - self._started_at
+
+    def start(self):
+        """Start a new partial output (e.g. when a crew is retried)."""
+        with self._lock:
+            self.partial_path.parent.mkdir(parents=True, exist_ok=True)
+            self.partial_path.write_text('')
+            self._started_at = time.monotonic()
+            self._first_output_at = None
+
+    def on_llm_new_token(self, token: str, **kwargs: typing.Any):
+        self._append(token)
+
+    def on_task_output(self, task_output):
+        """Task callback of the crew - `task_output` is a crewai `TaskOutput`."""
+        self._append(f'\n\n--- Task output: {task_output.summary} ---\n{task_output.raw_output}\n\n')
+
+    def finish(self, result: str):
+        with self._lock:
+            write_atomically(self.export_path, result)
+            self.partial_path.unlink(missing_ok=True)
+
+    def _append(self, text: str):
+        if not text:
+            return
+        with self._lock:
+            if self._first_output_at is None:
+                self._first_output_at = time.monotonic()
+            with open(self.partial_path, 'a') as file:
+                file.write(text)
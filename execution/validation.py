@@ -0,0 +1,300 @@
+import asyncio
+import json
+import os
+import re
+import textwrap
+import threading
+import time
+import typing
+from concurrent.futures import Future
+from pathlib import Path
+
+import rich
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from execution.consts import VALIDATION_BATCH_MAX_TOKENS, VALIDATION_BATCH_SIZE, VALIDATION_BATCH_WAIT_SECONDS
+from execution.streaming import write_atomically
+from llms.aio import AsyncLLMClient, get_event_loop
+from llms.tokens import estimate_tokens
+from utils import is_safe_path, sanitize_filename
+
+_JUDGE_ROLE = 'You are a Software QA Engineer who is responsible for validating the results of the crews.'
+_JSON_CODE_BLOCK_PATTERN = re.compile(r'^\s*```(?:json)?\s*(.*?)\s*```\s*$', re.DOTALL)
+
+
+class ValidationItem(typing.NamedTuple):
+    crew_name: str
+    result: str
+    expected_output: str
+    metrics: typing.Any
+    results_path: Path
+
+
+def get_validation_item(project_name: str,
+                        crew_name: str,
+                        result: str,
+                        validations: dict,
+                        user_inputs: dict,
+                        execution_id: str = None) -> ValidationItem:
+    """Resolve what the result of a crew is compared with, and the `.result` file its verdict is written into."""
+    result_suffix: str = f'.{sanitize_filename(execution_id)}.result' if execution_id else '.result'
+    validations_compare_to = validations[crew_name]['compare_to']
+    compare_to_filename: Path = (
+        Path.cwd()
+        / 'projects'
+        / project_name
+        / 'validations'
+        / validations_compare_to
+    )
+    if compare_to_filename.exists():
+        if is_safe_path(Path.cwd() / 'projects' / project_name, compare_to_filename):
+            with open(compare_to_filename, 'r') as file:
+                # validations_compare_to is a filename, overwrite var with its content to be used below
+                validations_compare_to = file.read()
+            validation_results_filename: Path = Path(f'{compare_to_filename}{result_suffix}') # no need to sanitize filename or check path traversal as just adding an extension to validated path.
+        else:
+            rich.print(
+                f"[bold red]Error: Path traversal detected in {compare_to_filename}[/bold red]"
+            )
+            os._exit(1)
+    else:
+        input_values_filename = f'{sanitize_filename("_".join(user_inputs.values()))}{result_suffix}'
+        validation_results_filename: Path = Path(
+            Path.cwd()
+            / 'projects'
+            / project_name
+            / 'validations'
+            / input_values_filename
+        )
+        if not is_safe_path(Path.cwd() / 'projects' / project_name, validation_results_filename):
+            rich.print(
+                f"[bold red]Error: Path traversal detected in {validation_results_filename}[/bold red]"
+            )
+            os._exit(1)
+
+    return ValidationItem(
+        crew_name=crew_name,
+        result=result,
+        expected_output=validations_compare_to,
+        metrics=validations[crew_name]['metrics'],
+        results_path=validation_results_filename,
+    )
+
+
+def get_judge_prompt(items: list[ValidationItem]) -> str:
+    """Build one judge prompt validating all the items, answered with the verdicts of each item by its index."""
+    validations: str = '\n'.join(
+        textwrap.dedent("""\
+            <<<<VALIDATION_START_MARKER id={index}>>>>
+            for each of the following checks:
+            <<<<METRICS_START_MARKER>>>>
+            {metrics}
+            <<<<METRICS_END_MARKER>>>>
+            compare the result with the expected output and indicate for each check if it succeeded or not.
+
+            <<<<RESULT_START_MARKER>>>>
+            {result}
+            <<<<RESULT_END_MARKER>>>>
+
+            <<<<EXPECTED_OUTPUT_START_MARKER>>>>
+            {expected_output}
+            <<<<EXPECTED_OUTPUT_END_MARKER>>>>
+            <<<<VALIDATION_END_MARKER id={index}>>>>
+        """).format(index=index, metrics=item.metrics, result=item.result, expected_output=item.expected_output)
+        for index, item in enumerate(items)
+    )
+    return textwrap.dedent("""\
+        IMPORTANT INSTRUCTIONS:
+        -----------------------
+        - output MUST be in json format without any additional text (output is used by other tools - !!!NOT ENCLOSED IN JSON CODE BLOCK!!!).
+        - output MUST contain a boolean result for each check of each validation.
+        - output MUST NOT include any text other than the json object!!
+
+        Validate each of the following {count} validations independently:
+
+        {validations}
+        Respond with a direct json string (not enclosed in json code-block) mapping the id of each validation to its checks
+        (failure requires reason, success does not):
+        -----------------------
+        {{"0": {{check_endpoint: {{res: false, reason: "the version of the API endpoint URL. The result uses `/v3/admin/users/` while the expected output uses `/v2/admin/users/`"}}, check_another_thing: {{res: true}}...}}, "1": {{check_something_else: {{res: false, reason: 'succinct reason for failue'}}...}}...}}
+        -----------------------
+
+        - You MUST provide comparison reason for each failed check - i.e., what is the difference between the actual and expected output for the specific check.
+        - Reason MUST be succinct and clear.
+    """).format(count=len(items), validations=validations)
+
+
+def parse_verdicts(response: str, count: int) -> dict[int, dict]:
+    """Get the verdicts of each validation of a judge response by index, skipping the malformed ones."""
+    match = _JSON_CODE_BLOCK_PATTERN.match(response)
+    if match:
+        response = match.group(1)
+    try:
+        verdicts = json.loads(response[response.find('{'):response.rfind('}') + 1])
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(verdicts, dict):
+        return {}
+    return {
+        index: verdicts[str(index)]
+        for index in range(count)
+        if isinstance(verdicts.get(str(index)), dict) and verdicts[str(index)]
+        and all(isinstance(verdict, dict) for verdict in verdicts[str(index)].values())
+    }
+
+
+class ValidationQueue:
+    """Validate crews results in the background, batching the validations into few judge calls.
+
+    Submitted validations are batched until `batch_size` of them (or `batch_max_tokens` prompt tokens) are
+    pending, or the oldest one waited `batch_wait_seconds`. Each batch is a single judge call on the shared event
+    loop, so several batches can be in flight. The verdicts are split back into the `.result` file of each
+    validation; the validations missing from a batch response are retried one by one, and the raw response is
+    written when a single validation can't be parsed either. Call `join` to wait for all submitted validations.
+    """
+
+    def __init__(self, llm: AsyncLLMClient,
+                 batch_size: int = VALIDATION_BATCH_SIZE,
+                 batch_max_tokens: int = VALIDATION_BATCH_MAX_TOKENS,
+                 batch_wait_seconds: float = VALIDATION_BATCH_WAIT_SECONDS):
+        self._llm: AsyncLLMClient = llm
+        self._batch_size: int = batch_size
+        self._batch_max_tokens: int = batch_max_tokens
+        self._batch_wait_seconds: float = batch_wait_seconds
+        # pending validations with their estimated prompt tokens and submission time
+        self._pending: list[tuple[ValidationItem, int, float]] = []
+        self._unfinished: int = 0
+        self._flushing: int = 0
+        self._condition = threading.Condition()
+        self._metrics: dict = {'validations': 0, 'judge_calls': 0, 'retries': 0, 'errors': 0}
+        threading.Thread(target=self._run, name='validation-queue', daemon=True).start()
+
+    def submit(self, item: ValidationItem):
+        tokens: int = estimate_tokens(f'{item.metrics}{item.result}{item.expected_output}')
+        with self._condition:
+            self._pending.append((item, tokens, time.monotonic()))
+            self._unfinished += 1
+            self._metrics['validations'] += 1
+            self._condition.notify_all()
+
+    def join(self):
+        """Send the pending validations right away, and wait until all the submitted validations are written."""
+        with self._condition:
+            self._flushing += 1
+            self._condition.notify_all()
+            try:
+                while self._unfinished:
+                    self._condition.wait()
+            finally:
+                self._flushing -= 1
+
+    @property
+    def metrics(self) -> dict:
+        """Number of validations, judge calls (including retries), retried validations and failed validations."""
+        with self._condition:
+            return dict(self._metrics)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._is_batch_ready():
+                    self._condition.wait(
+                        max(0.0, self._pending[0][2] + self._batch_wait_seconds - time.monotonic())
+                        if self._pending else None
+                    )
+                batch: list[ValidationItem] = self._take_batch()
+            future: Future = asyncio.run_coroutine_threadsafe(self._validate(batch), get_event_loop())
+            future.add_done_callback(lambda future, items=batch: self._on_validated(future, items))
+
+    def _is_batch_ready(self) -> bool:
+        return bool(self._pending) and (
+            self._flushing > 0
+            or len(self._pending) >= self._batch_size
+            or sum(tokens for _, tokens, _ in self._pending) >= self._batch_max_tokens
+            or time.monotonic() >= self._pending[0][2] + self._batch_wait_seconds
+        )
+
+    def _take_batch(self) -> list[ValidationItem]:
+        batch: list[ValidationItem] = []
+        batch_tokens: int = 0
+        while self._pending and len(batch) < self._batch_size:
+            item, tokens, _ = self._pending[0]
+            if batch and batch_tokens + tokens > self._batch_max_tokens:
+                break
+            self._pending.pop(0)
+            batch.append(item)
+            batch_tokens += tokens
+        return batch
+
+    def _on_validated(self, future: Future, items: list[ValidationItem]):
+        # errors of the judge call are handled in `_validate`, these are the ones writing the verdicts
+        error: typing.Optional[BaseException] = future.exception() if not future.cancelled() else asyncio.CancelledError()
+        if error is not None:
+            rich.print(f"[red bold]Error validating crews {[item.crew_name for item in items]}: {error!r}[/red bold]")
+            with self._condition:
+                self._metrics['errors'] += len(items)
+        self._finish(len(items))
+
+    def _finish(self, count: int):
+        with self._condition:
+            self._unfinished -= count
+            self._condition.notify_all()
+
+    async def _validate(self, items: list[ValidationItem]):
+        try:
+            response: str = await self._judge(items)
+        except Exception as e:
+            rich.print(f"[red bold]Error validating crews {[item.crew_name for item in items]}: {e}[/red bold]")
+            with self._condition:
+                self._metrics['errors'] += len(items)
+            for item in items:
+                # not a verdict - the benchmark report counts it apart from the failed validations
+                write_atomically(item.results_path, json.dumps({'error': f'Validation failed: {e}'}, indent=2))
+            return
+
+        verdicts: dict[int, dict] = parse_verdicts(response, len(items))
+        for index, item in enumerate(items):
+            if index in verdicts:
+                write_atomically(item.results_path, json.dumps(verdicts[index], indent=2))
+            elif len(items) == 1:
+                # as the inline validation did - the benchmark report flags it as unreadable
+                write_atomically(item.results_path, response)
+        missing: list[ValidationItem] = [item for index, item in enumerate(items) if index not in verdicts]
+        if len(items) > 1 and missing:
+            with self._condition:
+                self._metrics['retries'] += len(missing)
+            await asyncio.gather(*(self._validate([item]) for item in missing))
+
+    async def _judge(self, items: list[ValidationItem]) -> str:
+        with self._condition:
+            self._metrics['judge_calls'] += 1
+        response = await self._llm.ainvoke([
+            SystemMessage(content=_JUDGE_ROLE),
+            HumanMessage(content=get_judge_prompt(items)),
+        ])
+        return str(getattr(response, 'content', response))
+
+
+_validation_queues: dict[int, ValidationQueue] = {}
+_validation_queues_lock = threading.Lock()
+
+
+def get_validation_queue(llm: AsyncLLMClient) -> ValidationQueue:
+    """Get the process-wide validation queue of an LLM client, so concurrent executions share its batches."""
+    with _validation_queues_lock:
+        if id(llm.client) not in _validation_queues:
+            _validation_queues[id(llm.client)] = ValidationQueue(llm)
+        return _validation_queues[id(llm.client)]
+
+
+def wait_for_validations():
+    """Wait until all the validations submitted so far are written, and print the judge calls they took."""
+    with _validation_queues_lock:
+        validation_queues: list[ValidationQueue] = list(_validation_queues.values())
+    for validation_queue in validation_queues:
+        validation_queue.join()
+        metrics: dict = validation_queue.metrics
+        rich.print(
+            f"[grey]Validations: {metrics['validations']} validated in {metrics['judge_calls']} judge calls, "
+            f"{metrics['retries']} retried one by one, {metrics['errors']} failed[/grey]"
+        )
@@ -0,0 +1,116 @@
+import asyncio
+import functools
+import threading
+import typing
+
+import httpx
+
+from llms.rate_limiter import RATE_LIMIT_ACQUIRED, RateLimitedCache, get_client_rate_limiter
+from llms.tokens import estimate_tokens
+
+# default number of in-flight requests per provider, override with `max_concurrency` in config/llms/*.json
+DEFAULT_MAX_CONCURRENCY = 16
+
+_loop: typing.Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Get the process-wide event loop, running in a background thread started on first use.
+
+    The async clients (and their connection pools) are bound to this loop - drive them through `run`
+    from sync code, or schedule coroutines on it with `asyncio.run_coroutine_threadsafe`.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='llms-event-loop', daemon=True).start()
+        return _loop
+
+
+def run(coroutine: typing.Awaitable, timeout: typing.Optional[float] = None):
+    """Run a coroutine on the shared event loop from sync code and wait for its result."""
+    loop: asyncio.AbstractEventLoop = get_event_loop()
+    try:
+        running_loop: typing.Optional[asyncio.AbstractEventLoop] = asyncio.get_running_loop()
+    except RuntimeError:
+        running_loop = None
+    if running_loop is loop:
+        raise RuntimeError('Cannot wait for a coroutine from the shared event loop itself, await it instead')
+    return asyncio.run_coroutine_threadsafe(coroutine, loop).result(timeout)
+
+
+@functools.lru_cache(maxsize=None)
+def get_async_http_client() -> httpx.AsyncClient:
+    """Process-wide async HTTP client, for the async clients that accept one. Use it on the shared event loop only."""
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=200, max_keepalive_connections=50),
+        timeout=httpx.Timeout(600.0, connect=5.0),
+        follow_redirects=True,
+    )
+
+
+_semaphores: dict[str, asyncio.Semaphore] = {}
+_semaphores_lock = threading.Lock()
+
+
+def _get_semaphore(provider: str, max_concurrency: int) -> asyncio.Semaphore:
+    """Get the semaphore bounding the in-flight requests of a provider, created from the first limit seen for it."""
+    with _semaphores_lock:
+        if provider not in _semaphores:
+            _semaphores[provider] = asyncio.Semaphore(max_concurrency)
+        return _semaphores[provider]
+
+
+def _get_input_text(llm_input) -> str:
+    if isinstance(llm_input, str):
+        return llm_input
+    if isinstance(llm_input, (list, tuple)):
+        return '\n'.join(str(getattr(message, 'content', message)) for message in llm_input)
+    return str(llm_input)
+
+
+class AsyncLLMClient:
+    """Async access to an LLM client, with the in-flight requests of its provider bounded by a semaphore.
+
+    Requests wait for the provider rate limiter (if configured) without holding a thread, so many requests
+    can be in flight in one process. Coroutines must run on the shared event loop (see `run`).
+    """
+
+    def __init__(self, client, provider: str, max_concurrency: int = DEFAULT_MAX_CONCURRENCY):
+        self.client = client
+        self.provider: str = provider
+        self._max_concurrency: int = max_concurrency
+
+    async def ainvoke(self, llm_input, config: typing.Optional[dict] = None, **kwargs):
+        async with _get_semaphore(self.provider, self._max_concurrency):
+            rate_limiter = get_client_rate_limiter(self.client)
+            # a rate limited cache acquires on misses itself, so cached responses don't wait
+            if rate_limiter and not isinstance(getattr(self.client, 'cache', None), RateLimitedCache):
+                await rate_limiter.aacquire(estimate_tokens(_get_input_text(llm_input)))
+                config = {**(config or {}), 'metadata': {**(config or {}).get('metadata', {}), RATE_LIMIT_ACQUIRED: True}}
+            return await self.client.ainvoke(llm_input, config=config, **kwargs)
+
+    async def abatch(self, llm_inputs: typing.Iterable, return_exceptions: bool = False, **kwargs) -> list:
+        """Invoke the client with all the inputs concurrently, results in the order of the inputs."""
+        return await asyncio.gather(*(self.ainvoke(llm_input, **kwargs) for llm_input in llm_inputs),
+                                    return_exceptions=return_exceptions)
+
+    def invoke_many(self, llm_inputs: typing.Iterable, return_exceptions: bool = False, **kwargs) -> list:
+        """Sync entry point of `abatch`, running on the shared event loop."""
+        return run(self.abatch(list(llm_inputs), return_exceptions=return_exceptions, **kwargs))
+
+
+def get_async_llm_client(config: dict, namespace: typing.Optional[str] = None) -> AsyncLLMClient:
+    """Get the async client of an LLM config - the same config surface as `utils.get_llm_client`.
+
+    The underlying client is the shared one from the clients registry, so the response cache and the
+    rate limiter of the config apply to async requests too.
+    """
+    from utils import get_llm_client
+    return AsyncLLMClient(
+        get_llm_client(config, namespace=namespace),
+        provider=config['provider'],
+        max_concurrency=config.get('max_concurrency', DEFAULT_MAX_CONCURRENCY),
+    )
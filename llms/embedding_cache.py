@@ -0,0 +1,128 @@
+import array
+import functools
+import hashlib
+import sqlite3
+import threading
+import time
+import typing
+from pathlib import Path
+
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_CACHE_PATH = 'db/embeddings-cache.sqlite'
+EMBEDDING_CACHE_MAX_ENTRIES = 200000
+
+
+class EmbeddingStore:
+    """SQLite store of embedding vectors by key, evicting the least recently used above `max_entries`.
+
+    Vectors are stored as float64 bytes, so they are read back identical to the embedder output.
+    Safe to share between threads.
+    """
+
+    def __init__(self, path: typing.Union[str, Path], max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self._max_entries: int = max_entries
+        self._lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(str(path), timeout=30, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS embeddings ('
+                'key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used_at REAL NOT NULL)'
+            )
+            self._connection.execute('CREATE INDEX IF NOT EXISTS embeddings_last_used_at ON embeddings (last_used_at)')
+
+    def get_many(self, keys: list[str]) -> dict[str, list[float]]:
+        if not keys:
+            return {}
+        vectors: dict[str, list[float]] = {}
+        with self._lock, self._connection:
+            # stay under the SQLite variables limit
+            for start in range(0, len(keys), 500):
+                batch: list[str] = keys[start:start + 500]
+                placeholders: str = ', '.join('?' * len(batch))
+                for key, vector in self._connection.execute(
+                        f'SELECT key, vector FROM embeddings WHERE key IN ({placeholders})', batch):
+                    vectors[key] = array.array('d', vector).tolist()
+                self._connection.execute(
+                    f'UPDATE embeddings SET last_used_at = ? WHERE key IN ({placeholders})', [time.time(), *batch]
+                )
+        return vectors
+
+    def set_many(self, vectors: dict[str, list[float]]):
+        if not vectors:
+            return
+        now: float = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO embeddings (key, vector, last_used_at) VALUES (?, ?, ?)',
+                [(key, array.array('d', vector).tobytes(), now) for key, vector in vectors.items()],
+            )
+            (count,) = self._connection.execute('SELECT COUNT(*) FROM embeddings').fetchone()
+            if count > self._max_entries:
+                self._connection.execute(
+                    'DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used_at LIMIT ?)',
+                    (count - self._max_entries,),
+                )
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings served from an `EmbeddingStore` when the same text was already embedded by the same model.
+
+    Keys are the hash of `model_key` (what identifies the embedder and its parameters), the kind of embedding
+    (document or query - some models embed them differently) and the text. Only the texts missing from the
+    store are sent to the wrapped embedder. Other attributes are proxied to the wrapped embedder.
+    """
+
+    def __init__(self, embeddings: Embeddings, store: EmbeddingStore, model_key: str):
+        self.wrapped_embeddings: Embeddings = embeddings
+        self._store: EmbeddingStore = store
+        self._model_key: str = model_key
+
+    def __getattr__(self, name: str):
+        if name == 'wrapped_embeddings':
+            raise AttributeError(name)
+        return getattr(self.wrapped_embeddings, name)
+
+    def _make_key(self, kind: str, text: str) -> str:
+        return hashlib.sha256(f'{self._model_key}\0{kind}\0{text}'.encode()).hexdigest()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys: list[str] = [self._make_key('document', text) for text in texts]
+        vectors: dict[str, list[float]] = self._store.get_many(list(dict.fromkeys(keys)))
+        missing: dict[str, str] = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        if missing:
+            embedded: dict[str, list[float]] = dict(zip(
+                missing, self.wrapped_embeddings.embed_documents(list(missing.values()))
+            ))
+            self._store.set_many(embedded)
+            vectors.update(embedded)
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text: str) -> list[float]:
+        key: str = self._make_key('query', text)
+        vector: typing.Optional[list[float]] = self._store.get_many([key]).get(key)
+        if vector is None:
+            vector = self.wrapped_embeddings.embed_query(text)
+            self._store.set_many({key: vector})
+        return vector
+
+
+@functools.lru_cache(maxsize=None)
+def _get_embedding_store(path: str, max_entries: int) -> EmbeddingStore:
+    return EmbeddingStore(path=path, max_entries=max_entries)
+
+
+def get_cached_embeddings(embeddings: Embeddings, config: typing.Optional[dict], model_key: str) -> Embeddings:
+    """Wrap an embedder with the cache of an embedder config (its `cache` key), as is if the config doesn't enable one.
+
+    Example config:
+        "cache": {"enabled": true, "path": "db/embeddings-cache.sqlite", "max_entries": 200000}
+    """
+    if not config or not config.get('enabled', True):
+        return embeddings
+    store: EmbeddingStore = _get_embedding_store(
+        path=config.get('path') or EMBEDDING_CACHE_PATH,
+        max_entries=config.get('max_entries', EMBEDDING_CACHE_MAX_ENTRIES),
+    )
+    return CachedEmbeddings(embeddings, store=store, model_key=model_key)
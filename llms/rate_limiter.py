@@ -0,0 +1,243 @@
+import asyncio
+import email.utils
+import json
+import threading
+import time
+import typing
+from uuid import UUID
+
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.callbacks import BaseCallbackHandler
+
+from llms.tokens import estimate_tokens, get_token_usage
+
+
+# metadata of the calls whose rate limit was already acquired by the caller
+RATE_LIMIT_ACQUIRED = 'rate_limit_acquired'
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `per_minute` tokens per minute, holding at most `per_minute` tokens.
+
+    Reservations are taken immediately and may overdraw the bucket - the caller then waits the returned
+    delay, so callers are served in order and no lock is held while waiting. Not thread safe by itself.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity: float = per_minute
+        self._rate: float = per_minute / 60
+        self._level: float = per_minute
+        self._updated_at: float = time.monotonic()
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Take `amount` tokens out of the bucket, and get the seconds to wait until they are available."""
+        self._level = min(self.capacity, self._level + (now - self._updated_at) * self._rate)
+        self._updated_at = now
+        self._level -= min(amount, self.capacity)
+        return max(0.0, -self._level / self._rate)
+
+
+class RateLimiter:
+    """Client-side requests-per-minute and tokens-per-minute limiter of an LLM provider.
+
+    Every call first reserves a request and its estimated prompt tokens, and waits until both are available
+    (and until any `Retry-After` pause requested by the provider is over). The completion tokens are
+    accounted for once the call ends. Safe to share between threads.
+    """
+
+    def __init__(self, requests_per_minute: typing.Optional[float] = None, tokens_per_minute: typing.Optional[float] = None):
+        self._requests: typing.Optional[TokenBucket] = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._tokens: typing.Optional[TokenBucket] = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._paused_until: float = 0.0
+        self._lock = threading.Lock()
+        self._metrics: dict = {'requests': 0, 'waits': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0, 'pauses': 0}
+
+    def acquire(self, tokens: int = 0) -> float:
+        """Wait until a request of `tokens` prompt tokens is within the limits. Returns the seconds waited."""
+        wait: float = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def aacquire(self, tokens: int = 0) -> float:
+        """Like `acquire`, without blocking the event loop."""
+        wait: float = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def _reserve(self, tokens: int) -> float:
+        with self._lock:
+            now: float = time.monotonic()
+            wait: float = max(
+                self._requests.reserve(1, now) if self._requests else 0.0,
+                self._tokens.reserve(tokens, now) if self._tokens else 0.0,
+                self._paused_until - now,
+            )
+            self._metrics['requests'] += 1
+            if wait > 0:
+                self._metrics['waits'] += 1
+                self._metrics['wait_seconds'] += wait
+                self._metrics['max_wait_seconds'] = max(self._metrics['max_wait_seconds'], wait)
+        return max(wait, 0.0)
+
+    def consume(self, tokens: int):
+        """Account for tokens used without waiting (e.g. completion tokens, known once a call ended)."""
+        if self._tokens and tokens:
+            with self._lock:
+                self._tokens.reserve(tokens, time.monotonic())
+
+    def pause(self, seconds: float):
+        """Hold all the requests for `seconds` (e.g. the `Retry-After` of a 429 response)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._metrics['pauses'] += 1
+
+    @property
+    def metrics(self) -> dict:
+        """Number of requests, how many of them waited and for how long, and the number of `Retry-After` pauses."""
+        with self._lock:
+            return dict(self._metrics)
+
+
+def get_retry_after(exception: BaseException) -> typing.Optional[float]:
+    """Get the seconds to wait from the `Retry-After` header of a rate limit error, None if it has none."""
+    headers = getattr(getattr(exception, 'response', None), 'headers', None) or {}
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        retry_after: typing.Optional[str] = headers.get('retry-after')
+        if not retry_after:
+            return None
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            return max(0.0, email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimitCallbackHandler(BaseCallbackHandler):
+    """Throttle the calls of an LLM client through a `RateLimiter` (see the client `callbacks`).
+
+    LLM start callbacks run in the calling thread right before the request is sent, so waiting there holds the request.
+    Calls made through `llms.aio` acquire the limiter asynchronously beforehand and are flagged with the
+    `RATE_LIMIT_ACQUIRED` metadata, so they are only accounted for here. Clients with a response cache acquire
+    on cache misses instead (see `RateLimitedCache`, and `acquire=False`) - start callbacks run before the cache
+    lookup, and responses served from the cache must not wait.
+    """
+
+    def __init__(self, rate_limiter: RateLimiter, acquire: bool = True):
+        self.rate_limiter: RateLimiter = rate_limiter
+        self._acquire_on_start: bool = acquire
+        self._prompt_tokens: dict[UUID, int] = {}
+
+    def on_llm_start(self, serialized: dict, prompts: list[str], *, run_id: UUID,
+                     metadata: typing.Optional[dict] = None, **kwargs: typing.Any):
+        self._acquire(run_id, '\n'.join(prompts), metadata)
+
+    def on_chat_model_start(self, serialized: dict, messages: list, *, run_id: UUID,
+                            metadata: typing.Optional[dict] = None, **kwargs: typing.Any):
+        self._acquire(run_id, '\n'.join(str(message.content) for batch in messages for message in batch), metadata)
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: typing.Any):
+        estimated_prompt_tokens: int = self._prompt_tokens.pop(run_id, 0)
+        if any((generation.generation_info or {}).get('from_cache')
+               for generations in response.generations for generation in generations):
+            # served from the response cache, nothing was sent to the provider
+            return
+        prompt_tokens, completion_tokens = get_token_usage(response.llm_output)
+        if completion_tokens is None:
+            completion_tokens = sum(estimate_tokens(generation.text)
+                                    for generations in response.generations for generation in generations)
+        # correct the prompt estimate with the reported usage
+        self.rate_limiter.consume(completion_tokens + max(0, (prompt_tokens or 0) - estimated_prompt_tokens))
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: typing.Any):
+        self._prompt_tokens.pop(run_id, None)
+        retry_after: typing.Optional[float] = get_retry_after(error)
+        if retry_after:
+            self.rate_limiter.pause(retry_after)
+
+    def _acquire(self, run_id: UUID, prompt: str, metadata: typing.Optional[dict]):
+        tokens: int = estimate_tokens(prompt)
+        self._prompt_tokens[run_id] = tokens
+        if self._acquire_on_start and not (metadata or {}).get(RATE_LIMIT_ACQUIRED):
+            self.rate_limiter.acquire(tokens)
+
+
+def _get_prompt_text(prompt: str) -> str:
+    """Get the text of the messages of a cache lookup prompt (the serialized messages of a chat model call)."""
+    try:
+        return '\n'.join(str(message.get('kwargs', {}).get('content', '')) for message in json.loads(prompt))
+    except (ValueError, TypeError, AttributeError):
+        return prompt
+
+
+class RateLimitedCache(BaseCache):
+    """Response cache of a rate limited client, acquiring the rate limiter on cache misses only.
+
+    The client sends the request right after a miss, so waiting there holds the request, while the responses
+    served from the cache never wait. Other calls are delegated to the wrapped cache, which also gives its `repr`,
+    so the cache keys of the client don't change with its rate limit.
+    """
+
+    def __init__(self, cache: BaseCache, rate_limiter: RateLimiter):
+        self.cache: BaseCache = cache
+        self.rate_limiter: RateLimiter = rate_limiter
+
+    def __repr__(self) -> str:
+        return repr(self.cache)
+
+    def lookup(self, prompt: str, llm_string: str) -> typing.Optional[RETURN_VAL_TYPE]:
+        cached: typing.Optional[RETURN_VAL_TYPE] = self.cache.lookup(prompt, llm_string)
+        if cached is None:
+            self.rate_limiter.acquire(estimate_tokens(_get_prompt_text(prompt)))
+        return cached
+
+    async def alookup(self, prompt: str, llm_string: str) -> typing.Optional[RETURN_VAL_TYPE]:
+        cached: typing.Optional[RETURN_VAL_TYPE] = await asyncio.get_running_loop().run_in_executor(
+            None, self.cache.lookup, prompt, llm_string
+        )
+        if cached is None:
+            await self.rate_limiter.aacquire(estimate_tokens(_get_prompt_text(prompt)))
+        return cached
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE):
+        self.cache.update(prompt, llm_string, return_val)
+
+    def clear(self, **kwargs: typing.Any):
+        self.cache.clear(**kwargs)
+
+
+_rate_limiters: dict[str, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str, config: dict) -> RateLimiter:
+    """Get the process-wide rate limiter of a provider, created from the first `rate_limit` config seen for it.
+
+    Example config:
+        "rate_limit": {"requests_per_minute": 500, "tokens_per_minute": 90000}
+    """
+    with _rate_limiters_lock:
+        if provider not in _rate_limiters:
+            _rate_limiters[provider] = RateLimiter(
+                requests_per_minute=config.get('requests_per_minute'),
+                tokens_per_minute=config.get('tokens_per_minute'),
+            )
+        return _rate_limiters[provider]
+
+
+def get_rate_limiters() -> dict[str, RateLimiter]:
+    """Get the rate limiters created so far, by provider."""
+    with _rate_limiters_lock:
+        return dict(_rate_limiters)
+
+
+def get_client_rate_limiter(client) -> typing.Optional[RateLimiter]:
+    """Get the rate limiter throttling an LLM client, None if it isn't rate limited."""
+    for handler in getattr(client, 'callbacks', None) or []:
+        if isinstance(handler, RateLimitCallbackHandler):
+            return handler.rate_limiter
+    return None
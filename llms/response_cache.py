@@ -0,0 +1,128 @@
+import functools
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import typing
+import warnings
+from pathlib import Path
+
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.load import dumps, loads
+
+RESPONSE_CACHE_PATH = 'db/llm-response-cache.sqlite'
+RESPONSE_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+RESPONSE_CACHE_MAX_ENTRIES = 10000
+
+
+class ResponseCache(BaseCache):
+    """SQLite cache of chat models responses.
+
+    Responses are keyed by the model parameters (provider, model, temperature, ...) and the full list of
+    messages, within a namespace (the project name), so projects sharing the cache file never see each
+    other's responses. Entries older than `ttl_seconds` are ignored and removed, and when the file holds
+    more than `max_entries` responses the least recently used ones are evicted.
+    """
+
+    def __init__(self, path: typing.Union[str, Path], namespace: str = '',
+                 ttl_seconds: typing.Optional[float] = RESPONSE_CACHE_TTL_SECONDS,
+                 max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self._namespace: str = namespace
+        self._ttl_seconds: typing.Optional[float] = ttl_seconds
+        self._max_entries: int = max_entries
+        self._lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(str(path), timeout=30, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'namespace TEXT NOT NULL, key TEXT NOT NULL, response TEXT NOT NULL, '
+                'created_at REAL NOT NULL, last_used_at REAL NOT NULL, '
+                'PRIMARY KEY (namespace, key))'
+            )
+            self._connection.execute('CREATE INDEX IF NOT EXISTS responses_last_used_at ON responses (last_used_at)')
+
+    def __repr__(self) -> str:
+        # serializable chat models put the repr of their cache into `llm_string` (part of the keys), so it must
+        # not change between processes - the default repr has the object address
+        return f'{type(self).__name__}()'
+
+    @staticmethod
+    def _make_key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f'{llm_string}\n{prompt}'.encode()).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> typing.Optional[RETURN_VAL_TYPE]:
+        key: str = self._make_key(prompt, llm_string)
+        now: float = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                'SELECT response, created_at FROM responses WHERE namespace = ? AND key = ?',
+                (self._namespace, key),
+            ).fetchone()
+            if row is None:
+                return None
+            response, created_at = row
+            if self._ttl_seconds is not None and now - created_at > self._ttl_seconds:
+                self._connection.execute('DELETE FROM responses WHERE namespace = ? AND key = ?', (self._namespace, key))
+                return None
+            self._connection.execute(
+                'UPDATE responses SET last_used_at = ? WHERE namespace = ? AND key = ?', (now, self._namespace, key)
+            )
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            generations: list = [loads(generation) for generation in json.loads(response)]
+        for generation in generations:
+            # lets the usage ledger tell responses served from the cache
+            generation.generation_info = {**(generation.generation_info or {}), 'from_cache': True}
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE):
+        key: str = self._make_key(prompt, llm_string)
+        response: str = json.dumps([dumps(generation) for generation in return_val])
+        now: float = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO responses (namespace, key, response, created_at, last_used_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (self._namespace, key, response, now, now),
+            )
+            self._evict()
+
+    def clear(self, **kwargs: typing.Any):
+        """Remove the responses of the namespace."""
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM responses WHERE namespace = ?', (self._namespace,))
+
+    def _evict(self):
+        """Remove expired responses, then the least recently used ones above `max_entries`. Lock must be held."""
+        if self._ttl_seconds is not None:
+            self._connection.execute('DELETE FROM responses WHERE created_at < ?', (time.time() - self._ttl_seconds,))
+        (count,) = self._connection.execute('SELECT COUNT(*) FROM responses').fetchone()
+        if count > self._max_entries:
+            self._connection.execute(
+                'DELETE FROM responses WHERE rowid IN (SELECT rowid FROM responses ORDER BY last_used_at LIMIT ?)',
+                (count - self._max_entries,),
+            )
+
+
+@functools.lru_cache(maxsize=None)
+def _get_response_cache(path: str, namespace: str, ttl_seconds: typing.Optional[float], max_entries: int) -> ResponseCache:
+    return ResponseCache(path=path, namespace=namespace, ttl_seconds=ttl_seconds, max_entries=max_entries)
+
+
+def get_response_cache(config: typing.Optional[dict], namespace: typing.Optional[str] = None) -> typing.Optional[ResponseCache]:
+    """Get the response cache of an LLM config (its `response_cache` key), None if the config doesn't enable one.
+
+    Example config:
+        "response_cache": {"enabled": true, "path": "db/llm-response-cache.sqlite", "ttl_seconds": 604800, "max_entries": 10000}
+    """
+    if not config or not config.get('enabled', True):
+        return None
+    return _get_response_cache(
+        path=config.get('path') or RESPONSE_CACHE_PATH,
+        namespace=namespace or '',
+        ttl_seconds=config.get('ttl_seconds', RESPONSE_CACHE_TTL_SECONDS),
+        max_entries=config.get('max_entries', RESPONSE_CACHE_MAX_ENTRIES),
+    )
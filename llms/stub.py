@@ -0,0 +1,204 @@
+import ast
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import typing
+
+import httpx
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.pydantic_v1 import PrivateAttr
+
+from llms.tokens import estimate_tokens
+
+_TOOL_NAMES_PATTERN = re.compile(r'only one name of \[(.*?)\]', re.DOTALL)
+_METRICS_PATTERN = re.compile(r'<<<<METRICS_START_MARKER>>>>(.*?)<<<<METRICS_END_MARKER>>>>', re.DOTALL)
+_VALIDATION_PATTERN = re.compile(r'<<<<VALIDATION_START_MARKER id=(\w+)>>>>(.*?)<<<<VALIDATION_END_MARKER id=\1>>>>', re.DOTALL)
+_ROLE_PATTERN = re.compile(r'You are (.*?)\.')
+_TASK_PATTERN = re.compile(r'Current Task: (.*)')
+# a word and the whitespace after it, the unit the stub streams responses in
+_TOKEN_PATTERN = re.compile(r'\S*\s*')
+_FILLER_WORDS: list[str] = (
+    'stub response lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore'
+).split()
+
+
+class StubRateLimitError(Exception):
+    """A 429 response of the stub provider, shaped like the providers errors (`response.status_code`, `Retry-After`)."""
+
+    def __init__(self, retry_after_seconds: float):
+        super().__init__(f'Stub rate limit exceeded, retry after {retry_after_seconds} seconds')
+        self.response = httpx.Response(429, headers={'retry-after': str(retry_after_seconds)})
+
+
+class StubChatModel(BaseChatModel):
+    """Offline chat model with deterministic responses and a configurable latency, token and error model.
+
+    Responses follow the prompts of the crews:
+    - an agent with tools calls each of them (`tool_calls_per_task` times in total per task) with arguments
+      built from the tool signature, then gives its final answer,
+    - a validation prompt (metrics markers) gets a JSON verdict for each of its metrics, a batched validation
+      prompt gets them for each of its validations by id,
+    - any other prompt gets `response_template` (`{role}` and `{task}` placeholders) padded to
+      `response_words` words.
+    Latency is `latency_seconds` plus a jitter of up to `latency_jitter_seconds`, plus the completion tokens
+    at `tokens_per_second`. A share of the calls (`rate_limit_error_rate`, `timeout_error_rate`) fail with a
+    429 or a timeout. Random choices are seeded by `seed` and the prompt, so runs are reproducible.
+    With `streaming`, the response is reported word by word to the `on_llm_new_token` callbacks over the latency.
+    """
+
+    seed: int = 0
+    response_template: str = 'Stub final answer of {role} for: {task}'
+    response_words: int = 0
+    tool_calls_per_task: int = 1
+    verdict: bool = True
+    latency_seconds: float = 0.0
+    latency_jitter_seconds: float = 0.0
+    tokens_per_second: typing.Optional[float] = None
+    rate_limit_error_rate: float = 0.0
+    retry_after_seconds: float = 1.0
+    timeout_error_rate: float = 0.0
+    timeout_seconds: float = 5.0
+    streaming: bool = False
+
+    _calls: dict = PrivateAttr(default_factory=dict)
+    _calls_lock: typing.Any = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return 'stub'
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {'model_name': 'stub', 'seed': self.seed, 'response_template': self.response_template,
+                'response_words': self.response_words, 'tool_calls_per_task': self.tool_calls_per_task,
+                'verdict': self.verdict}
+
+    def _generate(self, messages: list[BaseMessage], stop: typing.Optional[list[str]] = None,
+                  run_manager=None, **kwargs: typing.Any) -> ChatResult:
+        result, latency, error = self._respond(messages)
+        if error or not (self.streaming and run_manager):
+            time.sleep(latency)
+        else:
+            tokens: list[str] = self._get_tokens(result)
+            for token in tokens:
+                time.sleep(latency / len(tokens))
+                run_manager.on_llm_new_token(token)
+        if error:
+            raise error
+        return result
+
+    async def _agenerate(self, messages: list[BaseMessage], stop: typing.Optional[list[str]] = None,
+                         run_manager=None, **kwargs: typing.Any) -> ChatResult:
+        result, latency, error = self._respond(messages)
+        if error or not (self.streaming and run_manager):
+            await asyncio.sleep(latency)
+        else:
+            tokens: list[str] = self._get_tokens(result)
+            for token in tokens:
+                await asyncio.sleep(latency / len(tokens))
+                await run_manager.on_llm_new_token(token)
+        if error:
+            raise error
+        return result
+
+    @staticmethod
+    def _get_tokens(result: ChatResult) -> list[str]:
+        return [token for token in _TOKEN_PATTERN.findall(result.generations[0].text) if token] or ['']
+
+    def _respond(self, messages: list[BaseMessage]) -> tuple[typing.Optional[ChatResult], float, typing.Optional[Exception]]:
+        """Get the response to the messages, the latency to simulate and the error to raise instead, if any."""
+        prompt: str = '\n'.join(str(message.content) for message in messages)
+        prompt_hash: str = hashlib.sha256(prompt.encode()).hexdigest()
+        with self._calls_lock:
+            # retries of the same prompt draw different numbers, so injected errors are not permanent
+            attempt: int = self._calls.get(prompt_hash, 0)
+            self._calls[prompt_hash] = attempt + 1
+        rng = random.Random(f'{self.seed}:{prompt_hash}:{attempt}')
+
+        latency: float = self.latency_seconds + rng.uniform(0, self.latency_jitter_seconds)
+        error_draw: float = rng.random()
+        if error_draw < self.rate_limit_error_rate:
+            return None, latency, StubRateLimitError(self.retry_after_seconds)
+        if error_draw < self.rate_limit_error_rate + self.timeout_error_rate:
+            return None, self.timeout_seconds, TimeoutError(f'Stub request timed out after {self.timeout_seconds} seconds')
+
+        text: str = self._get_response_text(prompt, rng)
+        completion_tokens: int = estimate_tokens(text)
+        if self.tokens_per_second:
+            latency += completion_tokens / self.tokens_per_second
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=text))],
+            llm_output={
+                'model_name': 'stub',
+                'token_usage': {
+                    'prompt_tokens': estimate_tokens(prompt),
+                    'completion_tokens': completion_tokens,
+                    'total_tokens': estimate_tokens(prompt) + completion_tokens,
+                },
+            },
+        ), latency, None
+
+    def _get_response_text(self, prompt: str, rng: random.Random) -> str:
+        validations: list[tuple[str, str]] = _VALIDATION_PATTERN.findall(prompt)
+        if validations:
+            return json.dumps({
+                validation_id: self._get_verdicts(_METRICS_PATTERN.search(validation).group(1))
+                for validation_id, validation in validations
+            })
+
+        metrics_match = _METRICS_PATTERN.search(prompt)
+        if metrics_match:
+            return f'Thought: I now can give a great answer\nFinal Answer: {json.dumps(self._get_verdicts(metrics_match.group(1)))}'
+
+        tool_names_match = _TOOL_NAMES_PATTERN.search(prompt)
+        tool_names: list[str] = [name.strip() for name in tool_names_match.group(1).split(',') if name.strip()] \
+            if tool_names_match else []
+        # the tools calls of the task so far are in the scratchpad, after the task prompt
+        tool_calls: int = prompt[prompt.rfind('Begin!'):].count('\nObservation:')
+        if tool_names and tool_calls < self.tool_calls_per_task:
+            tool_name: str = tool_names[tool_calls % len(tool_names)]
+            return (
+                f'Thought: I should use the {tool_name} tool\n'
+                f'Action: {tool_name}\n'
+                # a python dictionary, as the agent executor parses it
+                f'Action Input: {self._get_tool_arguments(prompt, tool_name)!r}'
+            )
+
+        role_match = _ROLE_PATTERN.search(prompt)
+        task_match = _TASK_PATTERN.search(prompt)
+        answer: str = self.response_template.format(
+            role=role_match.group(1) if role_match else 'agent',
+            task=task_match.group(1).strip() if task_match else prompt.strip().splitlines()[-1] if prompt.strip() else '',
+        )
+        padding: int = self.response_words - len(answer.split())
+        if padding > 0:
+            answer += '\n' + ' '.join(rng.choice(_FILLER_WORDS) for _ in range(padding))
+        return f'Thought: I now can give a great answer\nFinal Answer: {answer}'
+
+    def _get_verdicts(self, metrics: str) -> dict:
+        try:
+            names: list[str] = list(ast.literal_eval(metrics.strip()))
+        except (ValueError, SyntaxError, TypeError):
+            names = re.findall(r'^\s*(\w+)\s*:', metrics, re.MULTILINE) or ['result']
+        return {
+            name: {'res': True} if self.verdict else {'res': False, 'reason': 'stub verdict'}
+            for name in names
+        }
+
+    @staticmethod
+    def _get_tool_arguments(prompt: str, tool_name: str) -> dict:
+        """Build arguments from the tool signature in the tools description (`name: name(arg: 'type', ...) - ...`)."""
+        signature_match = re.search(rf'{re.escape(tool_name)}\((.*?)\) - ', prompt)
+        if not signature_match:
+            return {}
+        samples: dict[str, typing.Any] = {'string': 'stub', 'integer': 1, 'number': 1, 'boolean': True}
+        return {
+            argument: samples.get(argument_type, 'stub')
+            for argument, argument_type in re.findall(r"(\w+): '(\w+)'", signature_match.group(1))
+        }
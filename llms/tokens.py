@@ -0,0 +1,37 @@
+import functools
+import typing
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding():
+    """Get the local tokenizer (tiktoken `cl100k_base`), None if unavailable."""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding('cl100k_base')
+    except Exception:
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens of a text, for when the provider doesn't report them (or before a call).
+
+    Uses the `cl100k_base` encoding, falling back to ~4 characters per token when tiktoken is unavailable.
+    """
+    encoding = get_encoding()
+    if encoding is None:
+        return len(text) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def get_token_usage(llm_output: typing.Optional[dict]) -> tuple[typing.Optional[int], typing.Optional[int]]:
+    """Get the prompt and completion tokens reported by the provider, (None, None) if not reported."""
+    llm_output = llm_output or {}
+    # OpenAI, Azure OpenAI and Groq
+    usage: dict = llm_output.get('token_usage') or {}
+    if usage.get('prompt_tokens') is not None:
+        return usage.get('prompt_tokens'), usage.get('completion_tokens')
+    # Anthropic
+    usage = llm_output.get('usage') or {}
+    if usage.get('input_tokens') is not None:
+        return usage.get('input_tokens'), usage.get('output_tokens')
+    return None, None
@@ -1,8 +1,10 @@
 import os
+import typing
 from pathlib import Path
 import pydantic
 import yaml
 from execution.consts import BENCHMARK_CONFIG_PATH
+from execution.consts import CACHE_DIRECTORY_PATH, CACHE_MAX_SIZE_MB
 from execution.consts import EXIT_ON_ERROR
 from utils import is_safe_path
 import rich
@@ -12,6 +14,12 @@ class RuntimeSettings(pydantic.BaseModel):
     project_name: str
     benchmark_mode: bool = False
     ignore_cache: bool = False
+    max_parallel_crews: int = 1
+    benchmark_workers: int = 1
+    cache_dir: str = CACHE_DIRECTORY_PATH
+    cache_max_size_mb: int = CACHE_MAX_SIZE_MB
+    rerun_from: typing.Optional[str] = None
+    stream_output: bool = False
 
     def load_benchmark_file(self) -> dict:
         """Load the benchmark file for the project.
@@ -0,0 +1,193 @@
+import ast
+import functools
+import gzip
+import hashlib
+import json
+import os
+import tarfile
+import threading
+import typing
+from pathlib import Path
+
+from tools.github_client import get_github_session
+
+CLASS_INDEX_DIRECTORY = 'db/class-index'
+# python files above this size (generated code, vendored bundles) are not indexed
+MAX_INDEXED_FILE_SIZE = 1024 * 1024
+
+
+class ClassInfo(typing.NamedTuple):
+    name: str
+    file_path: str
+    # dotted names of the bases as written (`Base`, `module.Base`), in order
+    bases: list[str]
+    # source of each method defined in the class body
+    methods: dict[str, str]
+
+
+def _get_dotted_name(node: ast.expr) -> typing.Optional[str]:
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        value: typing.Optional[str] = _get_dotted_name(node.value)
+        return f'{value}.{node.attr}' if value else None
+    if isinstance(node, ast.Subscript):
+        # generic bases, e.g. `Base[T]`
+        return _get_dotted_name(node.value)
+    return None
+
+
+def index_source(source: str, file_path: str) -> list[ClassInfo]:
+    """Get the classes (nested ones included) defined in a python source, [] if it doesn't parse."""
+    try:
+        tree: ast.AST = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return []
+    return [
+        ClassInfo(
+            name=node.name,
+            file_path=file_path,
+            bases=[name for name in map(_get_dotted_name, node.bases) if name],
+            methods={
+                child.name: ast.get_source_segment(source, child) or ''
+                for child in node.body
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef))
+            },
+        )
+        for node in ast.walk(tree)
+        if isinstance(node, ast.ClassDef)
+    ]
+
+
+def _get_module_name(file_path: str) -> str:
+    module: str = file_path[:-len('.py')].replace('/', '.')
+    return module[:-len('.__init__')] if module.endswith('.__init__') else module
+
+
+class ClassIndex:
+    """In-memory index of the classes of a repository snapshot: their file, bases and methods."""
+
+    def __init__(self, classes: typing.Iterable[ClassInfo]):
+        self._classes: dict[str, list[ClassInfo]] = {}
+        for class_info in classes:
+            self._classes.setdefault(class_info.name, []).append(class_info)
+
+    def __len__(self) -> int:
+        return sum(map(len, self._classes.values()))
+
+    def get_classes(self, name: str) -> list[ClassInfo]:
+        return self._classes.get(name.rsplit('.', 1)[-1], [])
+
+    def resolve_base(self, base: str, subclass: typing.Optional[ClassInfo] = None) -> typing.Optional[ClassInfo]:
+        """Get the class a base name refers to.
+
+        Among classes of the same name, prefer the one of the subclass file, then the one whose module matches
+        the dotted prefix of the base (`module.Class`), then the one in the nearest module.
+        """
+        candidates: list[ClassInfo] = self.get_classes(base)
+        if len(candidates) <= 1:
+            return candidates[0] if candidates else None
+        if subclass:
+            for candidate in candidates:
+                if candidate.file_path == subclass.file_path:
+                    return candidate
+        if '.' in base:
+            prefix: str = base.rsplit('.', 1)[0]
+            for candidate in candidates:
+                module: str = _get_module_name(candidate.file_path)
+                if module == prefix or module.endswith(f'.{prefix}'):
+                    return candidate
+        if subclass:
+            subclass_parts: list[str] = subclass.file_path.split('/')
+            return max(candidates, key=lambda candidate: len(os.path.commonprefix(
+                [candidate.file_path.split('/'), subclass_parts]
+            )))
+        return candidates[0]
+
+    def get_mro(self, class_info: ClassInfo) -> list[ClassInfo]:
+        """Get a class and its indexed ancestors, depth first and left to right (bases out of the index are skipped)."""
+        mro: list[ClassInfo] = []
+        seen: set[tuple[str, str]] = set()
+
+        def visit(current: ClassInfo):
+            if (current.file_path, current.name) in seen:
+                return
+            seen.add((current.file_path, current.name))
+            mro.append(current)
+            for base in current.bases:
+                base_info: typing.Optional[ClassInfo] = self.resolve_base(base, current)
+                if base_info:
+                    visit(base_info)
+
+        visit(class_info)
+        return mro
+
+    def find_method(self, class_name: str, method_name: str) -> typing.Optional[tuple[ClassInfo, str]]:
+        """Find the class implementing a method for `class_name` and the method source, None if none does."""
+        for class_info in self.get_classes(class_name):
+            for ancestor in self.get_mro(class_info):
+                if method_name in ancestor.methods:
+                    return ancestor, ancestor.methods[method_name]
+        return None
+
+    def to_json(self) -> list[dict]:
+        return [class_info._asdict() for classes in self._classes.values() for class_info in classes]
+
+    @classmethod
+    def from_json(cls, data: list[dict]) -> 'ClassIndex':
+        return cls(ClassInfo(**class_info) for class_info in data)
+
+
+def build_class_index(tarball: typing.BinaryIO) -> ClassIndex:
+    """Index the python files of a repository tarball (as served by GitHub), read as a stream."""
+    classes: list[ClassInfo] = []
+    with tarfile.open(fileobj=tarball, mode='r|gz') as archive:
+        for member in archive:
+            if not member.isfile() or not member.name.endswith('.py') or member.size > MAX_INDEXED_FILE_SIZE:
+                continue
+            file = archive.extractfile(member)
+            if file is None:
+                continue
+            # GitHub tarballs have a single top-level `<owner>-<repo>-<sha>/` directory
+            file_path: str = member.name.split('/', 1)[-1]
+            classes += index_source(file.read().decode('utf-8', errors='replace'), file_path)
+    return ClassIndex(classes)
+
+
+_build_locks: dict[tuple[str, str], threading.Lock] = {}
+_build_locks_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=16)
+def get_class_index(repo_url: str, sha: str) -> ClassIndex:
+    """Get the class index of a repository commit (`repo_url` is its API URL): from memory, from the disk cache,
+    or built from its tarball.
+
+    The tarball is downloaded once per commit - a branch moving to a new commit gets a new index.
+    """
+    cache_path: Path = (
+        Path(CLASS_INDEX_DIRECTORY)
+        / hashlib.sha256(repo_url.lower().encode()).hexdigest()[:16]
+        / f'{sha}.json.gz'
+    )
+    with _build_locks_lock:
+        lock: threading.Lock = _build_locks.setdefault((repo_url, sha), threading.Lock())
+    with lock:
+        if cache_path.exists():
+            with gzip.open(cache_path, 'rt') as file:
+                return ClassIndex.from_json(json.load(file))
+
+        headers: dict[str, str] = {'Accept': 'application/vnd.github+json'}
+        if os.getenv('GITHUB_TOKEN'):
+            headers['Authorization'] = f'Bearer {os.getenv("GITHUB_TOKEN")}'
+        with get_github_session().get(f'{repo_url}/tarball/{sha}', headers=headers, stream=True, timeout=300) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            class_index: ClassIndex = build_class_index(response.raw)
+
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path: Path = cache_path.with_name(f'{cache_path.name}.{threading.get_ident()}.tmp')
+        with gzip.open(temp_path, 'wt') as file:
+            json.dump(class_index.to_json(), file)
+        os.replace(temp_path, cache_path)
+        return class_index
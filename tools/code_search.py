@@ -0,0 +1,317 @@
+import base64
+import fnmatch
+import heapq
+import json
+import os
+import re
+import sqlite3
+import subprocess
+import threading
+import typing
+from pathlib import Path
+
+# in the git directory of the repository, so the index follows the repository whatever the working directory
+CODE_SEARCH_INDEX_FILE_NAME = 'crews-control-code-search.sqlite'
+# larger files are not indexed, they are always scanned
+MAX_INDEXED_FILE_SIZE = 1024 * 1024
+MAX_LINE_LENGTH = 300
+GIT_GREP_THREADS = os.cpu_count() or 4
+# uncommitted files are searched with one `git grep` per batch of paths
+WORKING_TREE_PATHS_BATCH_SIZE = 500
+# characters with a special meaning in `git grep` basic regular expressions
+_REGEX_SPECIAL_CHARACTERS = re.compile(r'[.\[\]*^$\\]')
+
+
+class SearchMatch(typing.NamedTuple):
+    path: str
+    line_number: int
+    line: str
+
+    def __str__(self) -> str:
+        line: str = self.line if len(self.line) <= MAX_LINE_LENGTH else self.line[:MAX_LINE_LENGTH] + '...'
+        return f'{self.path}:{self.line_number}:{line}'
+
+
+class SearchPage(typing.NamedTuple):
+    matches: list[SearchMatch]
+    # pass back to get the next page, None on the last page
+    cursor: typing.Optional[str]
+    indexed: bool
+
+
+def encode_cursor(match: SearchMatch) -> str:
+    return base64.urlsafe_b64encode(json.dumps([match.path, match.line_number]).encode()).decode()
+
+
+def decode_cursor(cursor: typing.Optional[str]) -> typing.Optional[tuple[str, int]]:
+    if not cursor:
+        return None
+    try:
+        path, line_number = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(path), int(line_number)
+    except (ValueError, TypeError):
+        raise ValueError(f'Invalid cursor: {cursor}')
+
+
+def _git(repo_path: Path, *args: str) -> str:
+    return subprocess.run(['git', '-C', str(repo_path), *args], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          text=True, check=True).stdout
+
+
+class _BlobReader:
+    """Read blobs through a single `git cat-file --batch` process."""
+
+    def __init__(self, repo_path: Path):
+        self._process = subprocess.Popen(['git', '-C', str(repo_path), 'cat-file', '--batch'],
+                                         stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def read(self, sha: str) -> bytes:
+        self._process.stdin.write(f'{sha}\n'.encode())
+        self._process.stdin.flush()
+        header: list[bytes] = self._process.stdout.readline().split()
+        if len(header) < 3 or header[1] == b'missing':
+            return b''
+        content: bytes = self._process.stdout.read(int(header[2]))
+        self._process.stdout.read(1)  # trailing newline
+        return content
+
+    def __enter__(self) -> '_BlobReader':
+        return self
+
+    def __exit__(self, *exc_info):
+        self._process.stdin.close()
+        self._process.wait()
+
+
+def get_trigrams(content: bytes) -> set[bytes]:
+    content = content.lower()
+    return {content[i:i + 3] for i in range(len(content) - 2)}
+
+
+def matches_filters(path: str, pathspecs: typing.Sequence[str], file_types: typing.Sequence[str]) -> bool:
+    """Whether a path is in one of the pathspecs (globs or directories) and has one of the file types (extensions)."""
+    if file_types and not any(path.endswith(f'.{file_type.lstrip(".")}') for file_type in file_types):
+        return False
+    return not pathspecs or any(
+        fnmatch.fnmatch(path, pathspec) or path.startswith(pathspec.rstrip('/') + '/') or path == pathspec
+        for pathspec in pathspecs
+    )
+
+
+def _is_binary(content: bytes) -> bool:
+    return b'\0' in content[:8000]
+
+
+class TrigramIndex:
+    """Persistent trigram index of the files of a local git repository at a tree SHA (usually `HEAD^{tree}`).
+
+    Postings are kept per blob, so updating the index to a new tree only reads the blobs it doesn't have yet
+    and drops the ones no longer referenced. Binary files are recorded without trigrams and never match, files
+    above `MAX_INDEXED_FILE_SIZE` are recorded without trigrams and scanned on every search.
+    """
+
+    def __init__(self, repo_path: Path):
+        self.repo_path: Path = repo_path
+        # relative to the repository unless absolute (e.g. in a linked worktree, which gets an index of its own)
+        git_directory: Path = (repo_path / _git(repo_path, 'rev-parse', '--git-dir').strip()).resolve()
+        path: Path = git_directory / CODE_SEARCH_INDEX_FILE_NAME
+        self._connection = sqlite3.connect(str(path), timeout=60, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.executescript(
+                'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);'
+                'CREATE TABLE IF NOT EXISTS blobs (id INTEGER PRIMARY KEY, sha TEXT UNIQUE NOT NULL, '
+                'indexed INTEGER NOT NULL);'
+                'CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, blob_id INTEGER NOT NULL);'
+                'CREATE TABLE IF NOT EXISTS postings (trigram BLOB NOT NULL, blob_id INTEGER NOT NULL, '
+                'PRIMARY KEY (trigram, blob_id)) WITHOUT ROWID;'
+                'CREATE INDEX IF NOT EXISTS postings_blob_id ON postings (blob_id);'
+            )
+
+    @property
+    def tree_sha(self) -> typing.Optional[str]:
+        with self._lock:
+            row = self._connection.execute("SELECT value FROM meta WHERE key = 'tree_sha'").fetchone()
+        return row[0] if row else None
+
+    def update(self, tree_sha: str):
+        """Bring the index to a tree, reading only the blobs not indexed yet."""
+        # `<mode> <type> <sha>\t<path>` of every file of the tree
+        tree: dict[str, str] = {}
+        for entry in _git(self.repo_path, 'ls-tree', '-r', '-z', tree_sha).split('\0'):
+            if entry:
+                info, path = entry.split('\t', 1)
+                _, object_type, sha = info.split()
+                if object_type == 'blob':
+                    tree[path] = sha
+
+        with self._lock:
+            known: dict[str, int] = dict(self._connection.execute('SELECT sha, id FROM blobs'))
+        new_blobs: list[str] = sorted(set(tree.values()) - set(known))
+        with _BlobReader(self.repo_path) as blob_reader:
+            for start in range(0, len(new_blobs), 200):
+                contents: dict[str, bytes] = {sha: blob_reader.read(sha) for sha in new_blobs[start:start + 200]}
+                with self._lock, self._connection:
+                    for sha, content in contents.items():
+                        # binary: -1, indexed: 1, too large to index (always scanned): 0
+                        status: int = -1 if _is_binary(content) else int(len(content) <= MAX_INDEXED_FILE_SIZE)
+                        known[sha] = self._connection.execute(
+                            'INSERT INTO blobs (sha, indexed) VALUES (?, ?)', (sha, status)
+                        ).lastrowid
+                        if status == 1:
+                            self._connection.executemany(
+                                'INSERT OR IGNORE INTO postings (trigram, blob_id) VALUES (?, ?)',
+                                ((trigram, known[sha]) for trigram in get_trigrams(content)),
+                            )
+
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM files')
+            self._connection.executemany('INSERT INTO files (path, blob_id) VALUES (?, ?)',
+                                         ((path, known[sha]) for path, sha in tree.items()))
+            self._connection.execute('DELETE FROM postings WHERE blob_id NOT IN (SELECT blob_id FROM files)')
+            self._connection.execute('DELETE FROM blobs WHERE id NOT IN (SELECT blob_id FROM files)')
+            self._connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('tree_sha', ?)", (tree_sha,))
+
+    def get_candidates(self, literal: str) -> list[tuple[str, str]]:
+        """Get the (path, blob SHA) of the files that may contain a literal (of at least 3 characters), by path."""
+        trigrams: list[bytes] = sorted(get_trigrams(literal.encode()))
+        placeholders: str = ', '.join('?' * len(trigrams))
+        with self._lock:
+            return self._connection.execute(
+                'SELECT files.path, blobs.sha FROM files JOIN blobs ON blobs.id = files.blob_id '
+                'WHERE blobs.indexed = 0 OR blobs.id IN ('
+                f'SELECT blob_id FROM postings WHERE trigram IN ({placeholders}) '
+                'GROUP BY blob_id HAVING COUNT(*) = ?) '
+                'ORDER BY files.path',
+                (*trigrams, len(trigrams)),
+            ).fetchall()
+
+
+class CodeSearchEngine:
+    """Search the files of the working tree of a local git repository, a page of matches at a time.
+
+    Literal queries of 3 characters or more are answered from the trigram index of the `HEAD` tree, and only
+    the candidate files are scanned. Other queries (regular expressions, short literals), and every query while
+    the index is being built or brought to a new `HEAD`, run `git grep --threads` on the `HEAD` tree instead.
+    Index updates run in the background and only read the blobs that changed.
+    Files modified, added, deleted or untracked since `HEAD` (`git status`) are searched in the working tree instead.
+    """
+
+    def __init__(self, repo_path: Path):
+        self.repo_path: Path = repo_path
+        self._index: TrigramIndex = TrigramIndex(repo_path)
+        self._updating: typing.Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def search(self, query: str, pathspecs: typing.Sequence[str] = (), file_types: typing.Sequence[str] = (),
+               ignore_case: bool = False, max_results: int = 50, cursor: typing.Optional[str] = None) -> SearchPage:
+        after: typing.Optional[tuple[str, int]] = decode_cursor(cursor)
+        tree_sha: str = _git(self.repo_path, 'rev-parse', 'HEAD^{tree}').strip()
+        changed_paths: set[str] = self._get_changed_paths()
+        if self._is_index_ready(tree_sha) and len(query) >= 3 and not _REGEX_SPECIAL_CHARACTERS.search(query):
+            committed: typing.Iterator[SearchMatch] = self._search_index(query, pathspecs, file_types, ignore_case, after)
+            indexed: bool = True
+        else:
+            committed = self._git_grep(tree_sha, query, pathspecs, file_types, ignore_case, after)
+            indexed = False
+        changed: list[SearchMatch] = self._search_working_tree(
+            sorted(changed_paths), query, pathspecs, file_types, ignore_case, after
+        )
+        # both in (path, line number) order, so cursors work across them
+        matches = heapq.merge((match for match in committed if match.path not in changed_paths), changed)
+
+        page: list[SearchMatch] = []
+        try:
+            for match in matches:
+                if len(page) == max_results:
+                    return SearchPage(matches=page, cursor=encode_cursor(page[-1]), indexed=indexed)
+                page.append(match)
+        finally:
+            committed.close()
+        return SearchPage(matches=page, cursor=None, indexed=indexed)
+
+    def _get_changed_paths(self) -> set[str]:
+        """Get the paths that differ between `HEAD` and the working tree, untracked files included."""
+        # `XY <path>\0` per path, relative to the repository root
+        status: str = _git(self.repo_path, 'status', '--porcelain', '-z', '--untracked-files=all', '--no-renames')
+        return {entry[3:] for entry in status.split('\0') if entry}
+
+    def _search_working_tree(self, paths: list[str], query: str, pathspecs: typing.Sequence[str],
+                             file_types: typing.Sequence[str], ignore_case: bool,
+                             after: typing.Optional[tuple[str, int]]) -> list[SearchMatch]:
+        paths = [path for path in paths if (not after or path >= after[0]) and matches_filters(path, pathspecs, file_types)]
+        matches: list[SearchMatch] = []
+        for start in range(0, len(paths), WORKING_TREE_PATHS_BATCH_SIZE):
+            matches.extend(self._git_grep(
+                None, query, pathspecs, file_types, ignore_case, after,
+                paths=[f':(literal){path}' for path in paths[start:start + WORKING_TREE_PATHS_BATCH_SIZE]],
+            ))
+        return sorted(matches)
+
+    def _is_index_ready(self, tree_sha: str) -> bool:
+        if self._index.tree_sha == tree_sha:
+            return True
+        with self._lock:
+            if self._updating is None or not self._updating.is_alive():
+                self._updating = threading.Thread(target=self._index.update, args=(tree_sha,),
+                                                  name='code-search-index', daemon=True)
+                self._updating.start()
+        return False
+
+    def _search_index(self, query: str, pathspecs: typing.Sequence[str], file_types: typing.Sequence[str],
+                      ignore_case: bool, after: typing.Optional[tuple[str, int]]) -> typing.Iterator[SearchMatch]:
+        needle: str = query.lower() if ignore_case else query
+        with _BlobReader(self.repo_path) as blob_reader:
+            for path, sha in self._index.get_candidates(query):
+                if (after and path < after[0]) or not matches_filters(path, pathspecs, file_types):
+                    continue
+                content: str = blob_reader.read(sha).decode('utf-8', errors='replace')
+                # lines end at '\n' only, as in `git grep` - so both paths number lines (and resume cursors) alike
+                lines: list[str] = content.split('\n')
+                if lines[-1] == '':
+                    lines.pop()
+                for line_number, line in enumerate(lines, start=1):
+                    if (after and (path, line_number) <= after) or needle not in (line.lower() if ignore_case else line):
+                        continue
+                    yield SearchMatch(path=path, line_number=line_number, line=line)
+
+    def _git_grep(self, tree_sha: typing.Optional[str], query: str, pathspecs: typing.Sequence[str],
+                  file_types: typing.Sequence[str], ignore_case: bool, after: typing.Optional[tuple[str, int]],
+                  paths: typing.Sequence[str] = ()) -> typing.Iterator[SearchMatch]:
+        """Run `git grep` on a tree, or on the working tree (untracked files included) when `tree_sha` is None."""
+        command: list[str] = ['git', '-C', str(self.repo_path), 'grep', '-n', '-I', '--null', '--full-name',
+                              f'--threads={GIT_GREP_THREADS}', *(['-i'] if ignore_case else []), '-e', query,
+                              *([tree_sha] if tree_sha else ['--untracked']),
+                              # narrows the scan, the filters below are exact
+                              '--', *(paths or pathspecs or [f'*.{file_type.lstrip(".")}' for file_type in file_types])]
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            # `<tree>:<path>\0<line number>\0<line>` (`<path>` in the working tree) - git grep lists the files
+            # of a tree in path order
+            for output_line in process.stdout:
+                name, line_number, line = output_line.rstrip(b'\n').decode('utf-8', errors='replace').split('\0', 2)
+                path: str = name[len(tree_sha) + 1:] if tree_sha else name
+                if (after and (path, int(line_number)) <= after) or not matches_filters(path, pathspecs, file_types):
+                    continue
+                yield SearchMatch(path=path, line_number=int(line_number), line=line)
+            if process.wait() not in (0, 1):  # 1: no matches
+                raise RuntimeError(f'git grep failed: {process.stderr.read().decode(errors="replace").strip()}')
+        finally:
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+            process.stdout.close()
+            process.stderr.close()
+
+
+_engines: dict[Path, CodeSearchEngine] = {}
+_engines_lock = threading.Lock()
+
+
+def get_code_search_engine(repo_path: typing.Union[str, Path]) -> CodeSearchEngine:
+    """Get the process-wide search engine of a local git repository."""
+    repo_path = Path(_git(Path(repo_path), 'rev-parse', '--show-toplevel').strip()).resolve()
+    with _engines_lock:
+        if repo_path not in _engines:
+            _engines[repo_path] = CodeSearchEngine(repo_path)
+        return _engines[repo_path]
@@ -1,53 +1,62 @@
-import subprocess
 from crewai_tools import BaseTool
-from pathlib import Path
+from typing import Optional
+from tools.code_search import get_code_search_engine
 class GitSearchTool(BaseTool):
     """A tool that searches for a query string within a local git repository."""
     name: str = "GitSearchTool"
     description: str = (
         """
-        This tool executes a git search command in a local git repository folder using the provided query string.
-        The syntax for the query string is the same as the syntax for the `git grep` command.
+        This tool searches the files of a local git repository folder (including uncommitted changes) for the provided query string.
+        The syntax for the query string is the same as the syntax for the `git grep` command pattern.
+        Results are `path:line number:line`, a page of `max_results` at a time - pass the returned cursor to get the next page.
+        Narrow the search with `pathspec` (comma separated globs or directories, e.g. `src/,*.yaml`) and
+        `file_types` (comma separated extensions, e.g. `py,js`).
         """
     )
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
-    def _run(self, query: str, repo_path: str) -> str:
+    def _run(self, query: str, repo_path: str, pathspec: Optional[str] = None, file_types: Optional[str] = None,
+             ignore_case: bool = False, max_results: int = 50, cursor: Optional[str] = None) -> str:
         """Use the GitSearchTool."""
-        return self.git_search(query=query, repo_path=repo_path)
+        return self.git_search(query=query, repo_path=repo_path, pathspec=pathspec, file_types=file_types,
+                               ignore_case=ignore_case, max_results=max_results, cursor=cursor)
 
-    def git_search(self, query: str, repo_path: str) -> str:
+    def git_search(self, query: str, repo_path: str, pathspec: Optional[str] = None, file_types: Optional[str] = None,
+                   ignore_case: bool = False, max_results: int = 50, cursor: Optional[str] = None) -> str:
         """
-        Executes a git search command in the local git repository folder using the provided query string.
+        Searches the local git repository for the provided query string, a page of results at a time.
 
         Parameters:
         query (str): The query string to search for in the git repository. The syntax is the same as the `git grep` command.
         repo_path (str): The path to the local git repository.
+        pathspec (str): Comma separated globs or directories to search in.
+        file_types (str): Comma separated file extensions to search in.
+        ignore_case (bool): Whether to ignore the case of the query.
+        max_results (int): Maximum number of matching lines to return.
+        cursor (str): The cursor returned with the previous page of results.
 
         Returns:
-        str: The result of the git search command as a string.
+        str: The matching lines, followed by the cursor of the next page if there are more results.
 
         Raises:
-        Exception: If there is an issue with executing the git search command.
+        Exception: If there is an issue with executing the git search.
         """
         try:
-            # Construct the git search command
-            repo_path = Path(repo_path).resolve()
-            command = ['git', '-C', repo_path, 'grep', '-n', query]
-
-            # Execute the command using subprocess
-            result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-
-            # Check if the command was successful
-            if result.returncode == 0:
-                # Return the standard output of the git command
-                return result.stdout
-            else:
-                # Return the standard error if the command failed
-                return result.stderr
+            page = get_code_search_engine(repo_path).search(
+                query=query,
+                pathspecs=[item.strip() for item in (pathspec or '').split(',') if item.strip()],
+                file_types=[item.strip() for item in (file_types or '').split(',') if item.strip()],
+                ignore_case=ignore_case,
+                max_results=max(1, int(max_results)),
+                cursor=cursor,
+            )
         except Exception as e:
             # Return the exception message if an error occurs
             raise Exception(f"Failed to execute git search: {e}")
 
+        result = '\n'.join(map(str, page.matches)) or 'No matches found.'
+        if page.cursor:
+            result += f'\n\nMore results available - call again with cursor="{page.cursor}" to get the next page.'
+        return result
@@ -1,12 +1,29 @@
 from crewai_tools import BaseTool
 from github import Github, GithubException
-import os
+from llms.aio import run
+from tools.github_client import get_github_client
+import asyncio
+import calendar
+import collections
+import threading
 import time
 import ast
-import datetime
+import rich
 
 MAX_CONTENT_LEN = 10000
 SNIPPET_LEN = 1000
+# above this many hits, files contents are not fetched - the matching fragments are returned instead
+MAX_FETCHED_FILES = 10
+MAX_SEARCH_RESULTS = 100
+MAX_CONCURRENT_FETCHES = 8
+MAX_RATE_LIMIT_RETRIES = 3
+# longer rate limit waits (e.g. the hourly core limit) fail the search instead of holding the crew
+MAX_RATE_LIMIT_WAIT_SECONDS = 90
+PARSE_CACHE_MAX_ENTRIES = 4096
+
+# classes and methods of the python files by blob SHA - a blob SHA identifies its content
+_parse_cache: collections.OrderedDict = collections.OrderedDict()
+_parse_cache_lock = threading.Lock()
 
 class GitHubSearchTool(BaseTool):
     """A tool that searches for code snippets in a GitHub repository."""
@@ -58,81 +75,132 @@ Use this tool to search for specific query terms within a file in a GitHub repos
     
     def _run(self, repo_name: str, search_query: str) -> str:
         """Use the GitHubSearchTool."""
-        gh = Github(os.getenv('GITHUB_TOKEN'))
+        gh = get_github_client()
         query = f'{search_query} repo:{repo_name}'
         return self.execute_search(query=query, gh=gh)
     
     def execute_search(self, gh: Github, query: str) -> str:
-        try:
-            search_result = gh.search_code(query)
+        # GitHub calls run in the executor of the shared event loop, so rate limit waits don't hold a thread
+        return run(self._search(gh=gh, query=query))
+
+    async def _search(self, gh: Github, query: str) -> str:
+        search_result = gh.search_code(query, highlight=True)
+        total_count, items = await self._call(gh, lambda: (
+            search_result.totalCount, list(search_result[:MAX_SEARCH_RESULTS])
+        ))
+        if total_count > MAX_FETCHED_FILES:
+            error_message = 'Too many results. Please narrow down the search. Returning matching fragments without file content.'
             code_results = []
-            if search_result.totalCount > 10:
-                error_message = 'Too many results. Please narrow down the search. Returning without file content.'
-                for item in search_result:
-                    if item.path.endswith('.py'):
-                        classes, methods = self.parse_python_code('')
-                    else:
-                        classes, methods = [], []
-                    code_results.append({
-                        'filename': item.path,
-                        'content': error_message,
-                        'classes': classes,
-                        'methods': methods
-                    })
-            else:
-                for item in search_result:
-                    file_content = item.decoded_content.decode('utf-8')
-                    if item.path.endswith('.py'):
-                        classes, methods = self.parse_python_code(file_content)
-                    else:
-                        classes, methods = [], []
-
-                    if len(file_content) <= MAX_CONTENT_LEN:
-                        content = file_content
-                    else:
-                        if search_result.totalCount > 1:
-                            content = 'file content too large - narrow search to this file only!'
-                        else:
-                            content = file_content[:SNIPPET_LEN] + '\n\n...content too large - showing snippet only.'
-
-                    code_results.append({
-                        'filename': item.path,
-                        'content': content,
-                        'classes': classes,
-                        'methods': methods
-                    })
-            
+            for item in items:
+                classes, methods = self.get_cached_python_code(item.sha) or ([], [])
+                code_results.append({
+                    'filename': item.path,
+                    'content': error_message,
+                    'fragments': self.get_fragments(item),
+                    'classes': classes,
+                    'methods': methods
+                })
+            if total_count > len(items):
+                code_results.append({'more_results': total_count - len(items)})
             return str(code_results)
-        except GithubException as e:
-            if e.status == 403 and 'rate limit' in e.data['message'].lower():
-                print("Rate limit exceeded. Handling...")
-                return self.handle_rate_limit(gh=gh, query=query)
+
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_FETCHES)
+
+        async def fetch(item) -> dict:
+            # before fetching the content, which replaces the search hit data
+            fragments = self.get_fragments(item)
+            async with semaphore:
+                file_content = await self._call(gh, lambda: item.decoded_content.decode('utf-8', errors='replace'))
+            if item.path.endswith('.py'):
+                classes, methods = self.get_python_code(item.sha, file_content)
             else:
-                raise
+                classes, methods = [], []
 
-    def parse_python_code(self, code):
-        tree = ast.parse(code)
-        classes = [node.name for node in ast.walk(tree) if isinstance(node, ast.ClassDef)]
-        methods = [node.name for node in ast.walk(tree) if isinstance(node, ast.FunctionDef)]
-        return classes, methods
+            if len(file_content) <= MAX_CONTENT_LEN:
+                content = file_content
+            else:
+                if total_count > 1:
+                    content = 'file content too large - narrow search to this file only!'
+                else:
+                    content = file_content[:SNIPPET_LEN] + '\n\n...content too large - showing snippet only.'
 
-    def utc_to_local(self, utc_dt):
-        epoch = time.mktime(utc_dt.timetuple())
-        offset = datetime.datetime.fromtimestamp(epoch) - datetime.datetime.utcfromtimestamp(epoch)
-        return utc_dt + offset
+            return {
+                'filename': item.path,
+                'content': content,
+                'fragments': fragments,
+                'classes': classes,
+                'methods': methods
+            }
 
-    def handle_rate_limit(self, gh: Github, query: str) -> str:
-        current_time = time.time()
-        local_reset_timestamp: datetime = time.mktime(self.utc_to_local(gh.get_rate_limit().search.reset).timetuple())
-        print(f"Time until reset: {local_reset_timestamp - current_time} seconds")
+        return str(list(await asyncio.gather(*(fetch(item) for item in items))))
 
-        sleep_time = local_reset_timestamp - current_time + 10  # adding 10 seconds to ensure the limit is reset
+    async def _call(self, gh: Github, function):
+        """Run a blocking GitHub call in the executor, waiting out rate limits up to `MAX_RATE_LIMIT_RETRIES` times.
 
-        if sleep_time > 0:
-            print(f"Rate limit exceeded. Sleeping for {sleep_time} seconds.")
-            time.sleep(sleep_time)
+        Waits longer than `MAX_RATE_LIMIT_WAIT_SECONDS` are not waited out - the rate limit error is raised instead.
+        """
+        loop = asyncio.get_running_loop()
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            try:
+                return await loop.run_in_executor(None, function)
+            except GithubException as e:
+                if not self.is_rate_limit_error(e) or attempt == MAX_RATE_LIMIT_RETRIES:
+                    raise
+                sleep_time = await self.get_rate_limit_wait(gh=gh, error=e)
+                if sleep_time > MAX_RATE_LIMIT_WAIT_SECONDS:
+                    rich.print(f"[red bold]GitHub rate limit exceeded, resets in {sleep_time:.0f} seconds. Giving up.[/red bold]")
+                    raise
+                rich.print(f"[yellow bold]GitHub rate limit exceeded. Retrying in {sleep_time:.0f} seconds...[/yellow bold]")
+                await asyncio.sleep(sleep_time)
+
+    @staticmethod
+    def is_rate_limit_error(error: GithubException) -> bool:
+        message = error.data.get('message', '') if isinstance(error.data, dict) else str(error.data)
+        return error.status in (403, 429) and 'rate limit' in message.lower()
+
+    async def get_rate_limit_wait(self, gh: Github, error: GithubException) -> float:
+        """Seconds to wait until the rate limit resets, from the error headers or else the rate limit API."""
+        headers = {name.lower(): value for name, value in (error.headers or {}).items()}
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+        if headers.get('x-ratelimit-reset'):
+            reset_timestamp = float(headers['x-ratelimit-reset'])
         else:
-            print(f"Calculated negative sleep time: {sleep_time} seconds. Reset time might have already passed.")
+            reset = await asyncio.get_running_loop().run_in_executor(None, lambda: gh.get_rate_limit().search.reset)
+            reset_timestamp = calendar.timegm(reset.utctimetuple())
+        return max(0.0, reset_timestamp - time.time()) + 10  # adding 10 seconds to ensure the limit is reset
+
+    @staticmethod
+    def get_fragments(item) -> list:
+        """Get the text-match fragments (lines around the matches) of a search hit."""
+        # set by the search response (`highlight=True`), so reading them doesn't complete the object - `raw_data`
+        # would, fetching the file and replacing the search hit data
+        return [match.get('fragment', '') for match in item.text_matches or []]
+
+    @staticmethod
+    def get_cached_python_code(sha: str):
+        with _parse_cache_lock:
+            if sha in _parse_cache:
+                _parse_cache.move_to_end(sha)
+                return _parse_cache[sha]
+        return None
+
+    def get_python_code(self, sha: str, code: str):
+        """Get the classes and methods of a python file, parsed once per blob SHA."""
+        parsed = self.get_cached_python_code(sha)
+        if parsed is None:
+            parsed = self.parse_python_code(code)
+            with _parse_cache_lock:
+                _parse_cache[sha] = parsed
+                if len(_parse_cache) > PARSE_CACHE_MAX_ENTRIES:
+                    _parse_cache.popitem(last=False)
+        return parsed
 
-        print("Retrying the request...")
-        return self.execute_search(query)
+    def parse_python_code(self, code):
+        try:
+            tree = ast.parse(code)
+        except (SyntaxError, ValueError):
+            return [], []
+        classes = [node.name for node in ast.walk(tree) if isinstance(node, ast.ClassDef)]
+        methods = [node.name for node in ast.walk(tree) if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))]
+        return classes, methods
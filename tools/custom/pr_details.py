@@ -1,18 +1,25 @@
-from typing import Type, Any
+from typing import Type, Any, Optional
 from pydantic.v1 import BaseModel, Field
 from crewai_tools import BaseTool
-from github import Github
-import requests
-import os
+from tools.pr_snapshots import get_pr_snapshot
+
+# files whose diff is larger than this are listed without their diff - request them with `file_path`
+MAX_FILE_DIFF_SIZE = 50000
 
 class GitHubPRDetailsSchema(BaseModel):
     """Input schema for GitHub PR Details Fetch Tool."""
     gh_repo: str = Field(..., description="Full name of the repository (e.g., 'user/repo')")
     pr_number: int = Field(..., description="Number of the pull request")
+    file_path: Optional[str] = Field(default=None, description="Path of a single changed file to fetch the diff of")
+    page: int = Field(default=1, description="Page of changed files to fetch the diff of (see `pages`)")
+    page_size: int = Field(default=20, description="Number of changed files per page")
 
 class GitHubPRDetailsTool(BaseTool):
     name: str = "Fetch GitHub PR Details"
-    description: str = "A tool that fetches details of a specific pull request from GitHub."
+    description: str = (
+        "A tool that fetches details of a specific pull request from GitHub. "
+        "The diff is returned for a page of changed files (`page`), or for a single file (`file_path`)."
+    )
     args_schema: Type[BaseModel] = GitHubPRDetailsSchema
     gh_repo: str = "default/repo"  # Default GitHub repository
     pr_number: int = 1             # Default PR number
@@ -21,52 +28,41 @@ class GitHubPRDetailsTool(BaseTool):
         # Fetching GitHub repository and PR number from the provided arguments or defaults
         gh_repo = kwargs.get('gh_repo', self.gh_repo)
         pr_number = kwargs.get('pr_number', self.pr_number)
+        file_path = kwargs.get('file_path')
+        page = max(1, int(kwargs.get('page') or 1))
+        page_size = max(1, int(kwargs.get('page_size') or 20))
 
-        # Initializing GitHub client with an environment variable token
-        gh = Github(os.getenv('GITHUB_TOKEN'))
-        
-        # Getting the repository and pull request
-        repo = gh.get_repo(gh_repo)
-        pr = repo.get_pull(pr_number)
-
-        # Headers for the request to fetch diff content
-        headers = {
-            'Authorization': f'Bearer {os.getenv('GITHUB_TOKEN')}',
-            'Accept': 'application/vnd.github.diff'  # Media type for diff content
-        }
-
-        # Making a GET request to the diff_url with the necessary headers
-        diff_response = requests.get(f'https://api.github.com/repos/{gh_repo}/pulls/{pr_number}.diff',
-                                     headers=headers)
-
-        if diff_response.status_code == 200:
-            diff_content = diff_response.text
-            # Excluding certain files from the diff content (WIP: support pagination for large diffs)
-            excluded_files = [] # e.g., 'requirements.txt' (may have many hashes causing large diffs)
-            diff_lines = diff_content.split('\n')
-            filtered_diff_lines = []
-            skip_file = False
-
-            for line in diff_lines:
-                if line.startswith('diff --git'):
-                    file_name = line.split(' ')[-1].replace('b/', '')
-                    skip_file = file_name in excluded_files
+        # Snapshot of the PR at its head commit, shared by all the crews and runs
+        snapshot = get_pr_snapshot(gh_repo, pr_number)
 
-                if not skip_file:
-                    filtered_diff_lines.append(line)
+        if file_path:
+            file = snapshot.get_file(file_path)
+            if file is None:
+                return {
+                    'error': f'File {file_path} is not changed by the pull request',
+                    'files': [changed_file.path for changed_file in snapshot.files],
+                }
+            return {'file_path': file.path, 'size': file.size, 'diff_content': file.diff}
 
-            diff_content = '\n'.join(filtered_diff_lines)
-        else:
-            diff_content = f"Failed to fetch diff: HTTP {diff_response.status_code} - {diff_response.reason}"
+        pages = max(1, -(-len(snapshot.files) // page_size))
+        page_files = snapshot.files[(page - 1) * page_size:page * page_size]
 
         # Constructing the details of the pull request
         pr_details = {
-            'title': pr.title,
-            'description': pr.body,
-            'diff_url': pr.diff_url,
-            'diff_content': diff_content,
-            'comments': [{'user': comment.user.login, 'body': comment.body} for comment in pr.get_issue_comments()],
-            'review_comments': [{'user': comment.user.login, 'body': comment.body} for comment in pr.get_review_comments()]
+            'title': snapshot.title,
+            'description': snapshot.description,
+            'diff_url': snapshot.diff_url,
+            'diff_content': ''.join(
+                file.diff if file.size <= MAX_FILE_DIFF_SIZE
+                else f'diff --git a/{file.path} b/{file.path}\n'
+                     f'... diff too large ({file.size} bytes) - fetch it with file_path="{file.path}"\n'
+                for file in page_files
+            ),
+            'files': [{'path': file.path, 'size': file.size} for file in snapshot.files],
+            'page': page,
+            'pages': pages,
+            'comments': snapshot.comments,
+            'review_comments': snapshot.review_comments,
         }
 
         return pr_details
@@ -0,0 +1,245 @@
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import typing
+from pathlib import Path
+
+import requests
+import requests.adapters
+from github import Auth, Github
+from github.Requester import Requester
+
+GITHUB_CACHE_PATH = 'db/github-cache.sqlite'
+GITHUB_CACHE_MAX_SIZE_MB = 256
+GITHUB_POOL_SIZE = 32
+# headers of a 304 response that don't describe the cached body
+_NOT_MODIFIED_SKIPPED_HEADERS = {'content-length', 'content-encoding', 'transfer-encoding'}
+
+
+class ResponseStore:
+    """SQLite store of GitHub responses with their validators (`ETag`, `Last-Modified`) by request key.
+
+    When the stored bodies exceed `max_size_bytes`, the least recently used responses are evicted.
+    Safe to share between threads.
+    """
+
+    def __init__(self, path: typing.Union[str, Path], max_size_bytes: int):
+        self._max_size_bytes: int = max_size_bytes
+        self._lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(str(path), timeout=30, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, status INTEGER NOT NULL, headers TEXT NOT NULL, body TEXT NOT NULL, '
+                'etag TEXT, last_modified TEXT, size INTEGER NOT NULL, last_used_at REAL NOT NULL)'
+            )
+            self._connection.execute('CREATE INDEX IF NOT EXISTS responses_last_used_at ON responses (last_used_at)')
+
+    def get(self, key: str) -> typing.Optional[dict]:
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                'SELECT status, headers, body, etag, last_modified FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute('UPDATE responses SET last_used_at = ? WHERE key = ?', (time.time(), key))
+        status, headers, body, etag, last_modified = row
+        return {'status': status, 'headers': json.loads(headers), 'body': body,
+                'etag': etag, 'last_modified': last_modified}
+
+    def set(self, key: str, status: int, headers: dict, body: str):
+        size: int = len(body.encode())
+        if size > self._max_size_bytes:
+            return
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO responses (key, status, headers, body, etag, last_modified, size, last_used_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, status, json.dumps(headers), body, headers.get('etag'), headers.get('last-modified'),
+                 size, time.time()),
+            )
+            (total_size,) = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()
+            if total_size > self._max_size_bytes:
+                # evict the least recently used responses, down to 90% of the limit
+                self._connection.execute(
+                    'DELETE FROM responses WHERE key IN ('
+                    'SELECT key FROM (SELECT key, size, SUM(size) OVER (ORDER BY last_used_at, key) AS cumulative_size '
+                    'FROM responses) WHERE cumulative_size - size < ?)',
+                    (total_size - int(self._max_size_bytes * 0.9),),
+                )
+
+
+class ConditionalCache:
+    """HTTP cache of GET responses revalidated with `If-None-Match` / `If-Modified-Since`.
+
+    Every GET is sent, with the validators of the stored response if there is one. A `304 Not Modified`
+    (which GitHub doesn't count against the rate limit) is answered from the store, with the fresh rate
+    limit headers of the 304. Responses are keyed by URL, `Accept` and the credentials, so different tokens
+    never share entries.
+    """
+
+    def __init__(self, store: ResponseStore):
+        self._store: ResponseStore = store
+        self._lock = threading.Lock()
+        self._metrics: dict = {'requests': 0, 'conditional_requests': 0, 'hits': 0, 'stored': 0}
+
+    @staticmethod
+    def _make_key(url: str, headers: dict) -> str:
+        headers = {name.lower(): value for name, value in headers.items()}
+        return hashlib.sha256(
+            f'{url}\0{headers.get("accept", "")}\0{headers.get("authorization", "")}'.encode()
+        ).hexdigest()
+
+    def request(self, session: requests.Session, verb: str, url: str, headers: typing.Optional[dict] = None,
+                **kwargs: typing.Any) -> tuple[int, dict[str, str], str]:
+        """Send a request through the cache. Returns the status, the (lower case) headers and the body."""
+        headers = dict(headers or {})
+        if verb.upper() != 'GET':
+            response: requests.Response = session.request(verb, url, headers=headers, **kwargs)
+            return response.status_code, {k.lower(): v for k, v in response.headers.items()}, response.text
+
+        key: str = self._make_key(url, headers)
+        cached: typing.Optional[dict] = self._store.get(key)
+        if cached:
+            if cached['etag']:
+                headers.setdefault('If-None-Match', cached['etag'])
+            if cached['last_modified']:
+                headers.setdefault('If-Modified-Since', cached['last_modified'])
+        response = session.get(url, headers=headers, **kwargs)
+        response_headers: dict[str, str] = {k.lower(): v for k, v in response.headers.items()}
+
+        with self._lock:
+            self._metrics['requests'] += 1
+            self._metrics['conditional_requests'] += bool(cached)
+            self._metrics['hits'] += bool(cached and response.status_code == 304)
+        if cached and response.status_code == 304:
+            fresh_headers: dict[str, str] = {
+                name: value for name, value in response_headers.items() if name not in _NOT_MODIFIED_SKIPPED_HEADERS
+            }
+            return cached['status'], {**cached['headers'], **fresh_headers}, cached['body']
+        if response.status_code == 200 and ('etag' in response_headers or 'last-modified' in response_headers):
+            self._store.set(key, response.status_code, response_headers, response.text)
+            with self._lock:
+                self._metrics['stored'] += 1
+        return response.status_code, response_headers, response.text
+
+    @property
+    def metrics(self) -> dict:
+        """Number of GET requests, how many of them were revalidations and hits (304), and the responses stored."""
+        with self._lock:
+            metrics: dict = dict(self._metrics)
+        metrics['hit_rate'] = metrics['hits'] / metrics['requests'] if metrics['requests'] else 0.0
+        return metrics
+
+
+@functools.lru_cache(maxsize=None)
+def get_github_cache() -> ConditionalCache:
+    """Get the process-wide GitHub responses cache."""
+    return ConditionalCache(ResponseStore(
+        path=os.getenv('GITHUB_CACHE_PATH') or GITHUB_CACHE_PATH,
+        max_size_bytes=int(os.getenv('GITHUB_CACHE_MAX_SIZE_MB') or GITHUB_CACHE_MAX_SIZE_MB) * 1024 * 1024,
+    ))
+
+
+def get_github_cache_metrics() -> typing.Optional[dict]:
+    """Get the metrics of the GitHub responses cache, None if no GitHub request was made."""
+    return get_github_cache().metrics if get_github_cache.cache_info().currsize else None
+
+
+@functools.lru_cache(maxsize=None)
+def get_github_session(pool_size: int = GITHUB_POOL_SIZE, retry: typing.Any = None) -> requests.Session:
+    """Get the process-wide pooled HTTP session to GitHub."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        max_retries=requests.adapters.DEFAULT_RETRIES if retry is None else retry,
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def github_get(url: str, headers: typing.Optional[dict] = None, timeout: float = 60) -> tuple[int, dict[str, str], str]:
+    """GET a GitHub URL through the pooled session and the responses cache, with the `GITHUB_TOKEN` credentials."""
+    headers = dict(headers or {})
+    if os.getenv('GITHUB_TOKEN'):
+        headers.setdefault('Authorization', f'Bearer {os.getenv("GITHUB_TOKEN")}')
+    return get_github_cache().request(get_github_session(), 'GET', url, headers=headers, timeout=timeout)
+
+
+class _CachedResponse:
+    # mimics the httplib response object, like `github.Requester.RequestsResponse`
+    def __init__(self, status: int, headers: dict[str, str], text: str):
+        self.status: int = status
+        self.headers: dict[str, str] = headers
+        self.text: str = text
+
+    def getheaders(self):
+        return self.headers.items()
+
+    def read(self) -> str:
+        return self.text
+
+
+class _CachedConnection:
+    """PyGithub connection class sending the requests through the pooled session and the responses cache.
+
+    PyGithub creates a connection per request once connection classes are injected, so the connection only
+    holds the request and is safe to use from many threads with a single `Github` client.
+    """
+    protocol: str = 'https'
+
+    def __init__(self, host: str, port: typing.Optional[int] = None, strict: bool = False,
+                 timeout: typing.Optional[int] = None, retry: typing.Any = None,
+                 pool_size: typing.Optional[int] = None, **kwargs: typing.Any):
+        self.host: str = host
+        self.port: int = port or (443 if self.protocol == 'https' else 80)
+        self.timeout: typing.Optional[int] = timeout
+        self.verify = kwargs.get('verify', True)
+        self._session: requests.Session = get_github_session(pool_size or GITHUB_POOL_SIZE, retry)
+
+    def request(self, verb: str, url: str, input: typing.Any, headers: dict[str, str]):
+        self.verb, self.url, self.input, self.headers = verb, url, input, headers
+
+    def getresponse(self) -> _CachedResponse:
+        return _CachedResponse(*get_github_cache().request(
+            self._session,
+            self.verb,
+            f'{self.protocol}://{self.host}:{self.port}{self.url}',
+            headers=self.headers,
+            data=self.input,
+            timeout=self.timeout,
+            verify=self.verify,
+            allow_redirects=False,
+        ))
+
+    def close(self):
+        return
+
+
+class _CachedHTTPConnection(_CachedConnection):
+    protocol: str = 'http'
+
+
+# PyGithub takes its connection classes per process, not per client: once this module is imported, every `Github`
+# client of the process - including the ones created outside of this module - sends its requests through the pooled
+# session and the responses cache. Cached responses are revalidated on every request, so they are never stale.
+Requester.injectConnectionClasses(_CachedHTTPConnection, _CachedConnection)
+
+
+@functools.lru_cache(maxsize=None)
+def get_github_client(token: typing.Optional[str] = None):
+    """Get the process-wide GitHub client (of `token`, `GITHUB_TOKEN` by default).
+
+    Its requests share one connection pool and go through the responses cache, so repeated tool calls
+    within and across runs are mostly 304s, which don't count against the GitHub rate limits.
+    """
+    if token is None and os.getenv('GITHUB_TOKEN'):
+        return get_github_client(os.getenv('GITHUB_TOKEN'))
+    return Github(auth=Auth.Token(token) if token else None, pool_size=GITHUB_POOL_SIZE)
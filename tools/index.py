@@ -1,29 +1,17 @@
+import collections
+import functools
+import json
+import threading
 import typing
 from typing import Callable
 import os
 
-from crewai_tools.tools.directory_search_tool.directory_search_tool import DirectorySearchTool
-from crewai_tools.tools.serper_dev_tool.serper_dev_tool import SerperDevTool
-from crewai_tools import SeleniumScrapingTool
-
-from langchain_community.agent_toolkits.jira.toolkit import JiraToolkit
-from langchain_community.utilities.jira import JiraAPIWrapper
-from tools.custom.github_search import GitHubSearchTool
-from tools.custom.find_method_implementation import FindMethodImplementationTool
-from tools.custom.pr_details import GitHubPRDetailsTool
-from tools.custom.create_jira_issue import JiraTicketCreationTool
-from tools.custom.website_search_tool import WebsiteContentQueryTool
-from tools.custom.human import HumanTool
-from tools.custom.website_search_tool import WebsiteContentQueryTool
-from tools.custom.git_search_tool import GitSearchTool
-from tools.custom.fetch_file_content_tool import GitFileContentQueryTool
-from embedchain import App
-
-from langchain.agents import load_tools
 from utils import validate_env_vars, EnvironmentVariableNotSetError
-from utils import get_embedchain_settings
-import rich
-from rich.padding import Padding
+from utils import get_embedchain_settings, get_named_embedder_client
+from llms.embedding_cache import CachedEmbeddings
+
+# Tools (and their heavy dependencies - selenium, embedchain, Jira, ...) are imported and constructed
+# only when a project first asks for them through `get_tool`.
 
 tools_requiring_app = {
     'website_search',
@@ -31,63 +19,166 @@ tools_requiring_app = {
     'serper',
 }
 
+_APP_REQUIRED_VARS: list[str] = ["LLM_NAME", "EMBEDDER_NAME"]
+_JIRA_REQUIRED_VARS: list[str] = ["JIRA_API_TOKEN", "JIRA_USERNAME", "JIRA_INSTANCE_URL"]
+
+_TOOLS_REQUIRED_VARS: dict[str, list[str]] = {
+    'serper': ["SERPER_API_KEY", *_APP_REQUIRED_VARS],
+    'website_search': _APP_REQUIRED_VARS,
+    'directory_search': _APP_REQUIRED_VARS,
+    'jql_query': _JIRA_REQUIRED_VARS,
+    'create_issue': [*_JIRA_REQUIRED_VARS, "JIRA_CREATE_ISSUE_PROJECT_KEY"],
+    'github_search': ["GITHUB_TOKEN"],
+    'fetch_pr_content': ["GITHUB_TOKEN"],
+    'FindMethodImplementationTool': ["GITHUB_TOKEN"],
+}
+
+
+def _create_serper_tool(app):
+    from crewai_tools.tools.serper_dev_tool.serper_dev_tool import SerperDevTool
+    return SerperDevTool(app=app)
+
+def _create_website_search_tool(app):
+    from tools.custom.website_search_tool import WebsiteContentQueryTool
+    return WebsiteContentQueryTool(app=app)
+
+def _create_human_tool():
+    from tools.custom.human import HumanTool
+    return HumanTool()
+
+def _create_read_file_tool():
+    from langchain.agents import load_tools
+    return load_tools(['read_file'])[0]
+
+def _create_directory_search_tool(app):
+    from crewai_tools.tools.directory_search_tool.directory_search_tool import DirectorySearchTool
+    return DirectorySearchTool(app=app)
+
+@functools.lru_cache(maxsize=None)
+def _get_jira_toolkit():
+    from langchain_community.agent_toolkits.jira.toolkit import JiraToolkit
+    from langchain_community.utilities.jira import JiraAPIWrapper
+    jira = JiraAPIWrapper(
+        jira_api_token=os.getenv('JIRA_API_TOKEN'),
+        jira_username=os.getenv('JIRA_USERNAME'),
+        jira_instance_url=os.getenv('JIRA_INSTANCE_URL')
+    )
+    return JiraToolkit.from_jira_api_wrapper(jira)
+
+def _create_jql_query_tool():
+    return _get_jira_toolkit().get_tools()[0] # 'JQL Query
+
+def _create_selenium_tool():
+    from crewai_tools import SeleniumScrapingTool
+    return SeleniumScrapingTool()
+
+def _create_github_search_tool():
+    from tools.custom.github_search import GitHubSearchTool
+    return GitHubSearchTool()
+
+def _create_pr_details_tool():
+    from tools.custom.pr_details import GitHubPRDetailsTool
+    return GitHubPRDetailsTool()
+
+def _create_find_method_implementation_tool():
+    from tools.custom.find_method_implementation import FindMethodImplementationTool
+    return FindMethodImplementationTool()
+
+def _create_jira_issue_tool():
+    from tools.custom.create_jira_issue import JiraTicketCreationTool
+    return JiraTicketCreationTool()
+
+def _create_git_search_tool():
+    from tools.custom.git_search_tool import GitSearchTool
+    return GitSearchTool()
+
+def _create_git_file_content_tool():
+    from tools.custom.fetch_file_content_tool import GitFileContentQueryTool
+    return GitFileContentQueryTool()
+
+
 _TOOLS_MAP: dict[str, Callable] = {
-    'serper': lambda app: SerperDevTool(app=app),
-    'website_search': lambda app: WebsiteContentQueryTool(app=app),
-    'human': lambda: HumanTool(),
-    'read_file': lambda: load_tools(['read_file'])[0],
-    'directory_search': lambda app: DirectorySearchTool(app=app),
-    'jql_query': lambda: jira_toolkit.get_tools()[0], # 'JQL Query
-    'selenium': lambda: SeleniumScrapingTool(),
-    'github_search': lambda: GitHubSearchTool(),
-    'fetch_pr_content': lambda: GitHubPRDetailsTool(),
-    'FindMethodImplementationTool': lambda: FindMethodImplementationTool(),
-    'create_issue': lambda: JiraTicketCreationTool(),
-    'git_search': lambda: GitSearchTool(),
-    'fetch_file_content': lambda: GitFileContentQueryTool(),
+    'serper': _create_serper_tool,
+    'website_search': _create_website_search_tool,
+    'human': _create_human_tool,
+    'read_file': _create_read_file_tool,
+    'directory_search': _create_directory_search_tool,
+    'jql_query': _create_jql_query_tool,
+    'selenium': _create_selenium_tool,
+    'github_search': _create_github_search_tool,
+    'fetch_pr_content': _create_pr_details_tool,
+    'FindMethodImplementationTool': _create_find_method_implementation_tool,
+    'create_issue': _create_jira_issue_tool,
+    'git_search': _create_git_search_tool,
+    'fetch_file_content': _create_git_file_content_tool,
 }
 
-required_vars = [
-    "JIRA_API_TOKEN",
-    "JIRA_USERNAME",
-    "JIRA_INSTANCE_URL",
-    "JIRA_CREATE_ISSUE_PROJECT_KEY",
-    "GITHUB_TOKEN",
-    "SERPER_API_KEY",
-    "LLM_NAME",
-    "EMBEDDER_NAME",
-]
-
-try:
-    validate_env_vars(*required_vars)
-except EnvironmentVariableNotSetError as e:
-        rich.print(
-            Padding(
-                f"[bold red]Error: {str(e)}[/bold red]",
-                (2, 4),
-                expand=True,
-                style="bold red",
-            )
-        )
-        os._exit(1)
-
-jira = JiraAPIWrapper(
-    jira_api_token=os.getenv('JIRA_API_TOKEN'),
-    jira_username=os.getenv('JIRA_USERNAME'),
-    jira_instance_url=os.getenv('JIRA_INSTANCE_URL')
-)
-jira_toolkit = JiraToolkit.from_jira_api_wrapper(jira)
+
+APP_POOL_SIZE: int = 16
+
+_apps_pool: collections.OrderedDict = collections.OrderedDict()
+_apps_pool_lock = threading.Lock()
+
+
+def _close_app(app):
+    """Release the resources held by an App evicted from the pool."""
+    db_session = getattr(app, 'db_session', None)
+    if db_session is not None:
+        db_session.close()
+
+
+def _set_app_embedder(app, embedder):
+    """Embed the documents and queries of an App with `embedder` instead of the embedder built by embedchain."""
+    from embedchain.embedder.base import BaseEmbedder
+    app.embedding_model.set_embedding_fn(BaseEmbedder._langchain_default_concept(embedder))
+    # the vector DB collection keeps the embedding function it was opened with
+    app.db.set_collection_name(app.db.config.collection_name)
+
+
+def _get_app(task_id: str):
+    """Get the embedchain App of the task scope and models configuration.
+
+    Apps are pooled and reused across agents, tasks and crews - building one opens a vector DB and
+    an embedder. The pool keeps the `APP_POOL_SIZE` most recently used Apps and closes evicted ones.
+    When the embeddings cache is enabled, the App embeds through the cached embedder client.
+    """
+    from embedchain import App
+    settings: dict = get_embedchain_settings(task_id=task_id,
+                                             llm_name=os.getenv('LLM_NAME'),
+                                             embedder_name=os.getenv('EMBEDDER_NAME'))
+    key: str = json.dumps(settings, sort_keys=True, default=str)
+    with _apps_pool_lock:
+        if key in _apps_pool:
+            _apps_pool.move_to_end(key)
+            return _apps_pool[key]
+        app = App.from_config(config=settings)
+        embedder = get_named_embedder_client(os.getenv('EMBEDDER_NAME'))
+        if isinstance(embedder, CachedEmbeddings):
+            _set_app_embedder(app, embedder)
+        _apps_pool[key] = app
+        while len(_apps_pool) > APP_POOL_SIZE:
+            _, evicted_app = _apps_pool.popitem(last=False)
+            _close_app(evicted_app)
+        return app
+
+
+def validate_tools_env_vars(tool_names: typing.Iterable[str]):
+    """Check that the environment variables required by the given tools are set.
+
+    Raise `EnvironmentVariableNotSetError` for the first missing variable.
+    """
+    for tool_name in tool_names:
+        validate_env_vars(_TOOLS_REQUIRED_VARS.get(tool_name) or [])
+
 
 def get_tool(tool_name: str, task_id: typing.Optional[str] = None) -> Callable:
+    if tool_name not in _TOOLS_MAP:
+        raise ValueError(f"Tool '{tool_name}' not found")
+    validate_tools_env_vars([tool_name])
     try:
         if tool_name in tools_requiring_app:
-                app = App.from_config(config=get_embedchain_settings(task_id=task_id or 'shared',
-                                                                    llm_name=os.getenv('LLM_NAME'),
-                                                                    embedder_name=os.getenv('EMBEDDER_NAME')))
-                return _TOOLS_MAP[tool_name](app=app)
+            return _TOOLS_MAP[tool_name](app=_get_app(task_id=task_id or 'shared'))
         else:
             return _TOOLS_MAP[tool_name]()
-    except KeyError as e:
-        raise ValueError(f"Tool '{tool_name}' not found: {e}")
     except Exception as e:
         raise Exception(f"Failed to get tool: {e}")
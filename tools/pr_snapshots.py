@@ -0,0 +1,137 @@
+import collections
+import gzip
+import hashlib
+import json
+import os
+import threading
+import typing
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from tools.github_client import get_github_client, github_get
+
+PR_SNAPSHOTS_DIRECTORY = 'db/pr-snapshots'
+# snapshots kept in memory, the most recently used ones
+PR_SNAPSHOTS_MEMORY_SIZE = 32
+
+
+class FileDiff(typing.NamedTuple):
+    path: str
+    size: int
+    diff: str
+
+
+class PRSnapshot(typing.NamedTuple):
+    repo: str
+    number: int
+    head_sha: str
+    title: str
+    description: typing.Optional[str]
+    diff_url: str
+    comments: list[dict]
+    review_comments: list[dict]
+    files: list[FileDiff]
+
+    def get_file(self, path: str) -> typing.Optional[FileDiff]:
+        return next((file for file in self.files if file.path == path), None)
+
+    def to_json(self) -> dict:
+        return {**self._asdict(), 'files': [file._asdict() for file in self.files]}
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'PRSnapshot':
+        return cls(**{**data, 'files': [FileDiff(**file) for file in data['files']]})
+
+
+def split_diff(diff: str) -> list[FileDiff]:
+    """Split a unified diff into the diff of each file (sizes in bytes)."""
+    chunks: list[str] = []
+    for line in diff.splitlines(keepends=True):
+        if line.startswith('diff --git') or not chunks:
+            chunks.append('')
+        chunks[-1] += line
+    files: list[FileDiff] = []
+    for chunk in chunks:
+        header: str = chunk.split('\n', 1)[0]
+        # `diff --git a/<path> b/<path>`
+        path: str = header.rsplit(' b/', 1)[-1] if header.startswith('diff --git') else ''
+        files.append(FileDiff(path=path, size=len(chunk.encode()), diff=chunk))
+    return files
+
+
+def _fetch_diff(repo_url: str, pr_number: int) -> str:
+    status, _, text = github_get(f'{repo_url}/pulls/{pr_number}', headers={'Accept': 'application/vnd.github.diff'})
+    if status != 200:
+        raise RuntimeError(f"Failed to fetch diff: HTTP {status} - {text[:200]}")
+    return text
+
+
+_snapshots: collections.OrderedDict = collections.OrderedDict()
+_snapshot_locks: dict[tuple[str, int, str], threading.Lock] = {}
+_snapshots_lock = threading.Lock()
+
+
+def _get_version(pr) -> str:
+    """Identify the state of a pull request: a push moves its head commit, a new comment bumps its `updated_at`."""
+    return f'{pr.head.sha}-{pr.updated_at.strftime("%Y%m%dT%H%M%S")}'
+
+
+def _build_snapshot(repo_name: str, pr) -> PRSnapshot:
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        diff = executor.submit(_fetch_diff, pr.base.repo.url, pr.number)
+        comments = executor.submit(lambda: [
+            {'user': comment.user.login, 'body': comment.body} for comment in pr.get_issue_comments()
+        ])
+        review_comments = executor.submit(lambda: [
+            {'user': comment.user.login, 'body': comment.body} for comment in pr.get_review_comments()
+        ])
+        return PRSnapshot(
+            repo=repo_name,
+            number=pr.number,
+            head_sha=pr.head.sha,
+            title=pr.title,
+            description=pr.body,
+            diff_url=pr.diff_url,
+            comments=comments.result(),
+            review_comments=review_comments.result(),
+            files=split_diff(diff.result()),
+        )
+
+
+def get_pr_snapshot(repo_name: str, pr_number: int) -> PRSnapshot:
+    """Get the snapshot of a pull request in its current state.
+
+    The PR metadata is fetched on every call (mostly a 304 from the GitHub responses cache). The diff, issue
+    comments and review comments are fetched concurrently once per state - head commit and `updated_at` - and
+    reused (from memory, or from `db/pr-snapshots/`) by every crew and run until commits are pushed or comments
+    are added.
+    """
+    pr = get_github_client().get_repo(repo_name).get_pull(pr_number)
+    key: tuple[str, int, str] = (repo_name, pr_number, _get_version(pr))
+    cache_path: Path = (
+        Path(PR_SNAPSHOTS_DIRECTORY)
+        / hashlib.sha256(repo_name.lower().encode()).hexdigest()[:16]
+        / f'{pr_number}-{key[2]}.json.gz'
+    )
+    with _snapshots_lock:
+        lock: threading.Lock = _snapshot_locks.setdefault(key, threading.Lock())
+    with lock:
+        with _snapshots_lock:
+            if key in _snapshots:
+                _snapshots.move_to_end(key)
+                return _snapshots[key]
+        if cache_path.exists():
+            with gzip.open(cache_path, 'rt') as file:
+                snapshot: PRSnapshot = PRSnapshot.from_json(json.load(file))
+        else:
+            snapshot = _build_snapshot(repo_name, pr)
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path: Path = cache_path.with_name(f'{cache_path.name}.{threading.get_ident()}.tmp')
+            with gzip.open(temp_path, 'wt') as file:
+                json.dump(snapshot.to_json(), file)
+            os.replace(temp_path, cache_path)
+        with _snapshots_lock:
+            _snapshots[key] = snapshot
+            while len(_snapshots) > PR_SNAPSHOTS_MEMORY_SIZE:
+                _snapshots.popitem(last=False)
+        return snapshot
@@ -7,7 +7,14 @@ from langchain_community.embeddings import GPT4AllEmbeddings
 import json
 from pathlib import Path
 import re
+import functools
+import threading
+import httpx
 from langchain_community.embeddings import HuggingFaceEmbeddings
+from llms.aio import get_async_http_client
+from llms.embedding_cache import get_cached_embeddings
+from llms.rate_limiter import RateLimitCallbackHandler, RateLimitedCache, get_rate_limiter
+from llms.response_cache import get_response_cache
 
 class EnvironmentVariableNotSetError(Exception):
     pass
@@ -33,9 +40,31 @@ def validate_env_vars(*vars):
         if os.getenv(var) is None or os.getenv(var) == "":
             raise EnvironmentVariableNotSetError(f"Environment variable '{var}' is not set.")
 
-def create_llm_client(config):
+@functools.lru_cache(maxsize=None)
+def get_http_client() -> httpx.Client:
+    """Process-wide HTTP client, so all the clients that accept one share its connection pool.
+
+    Not passed to the langchain-openai clients - their pinned version hands the same `http_client` to the
+    async OpenAI client too, which rejects a sync client. Those share a pool per configuration instead
+    (see `_get_registered_client`).
+    """
+    return httpx.Client(
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        timeout=httpx.Timeout(600.0, connect=5.0),
+        follow_redirects=True,
+    )
+
+def create_llm_client(config, namespace=None):
     provider = config['provider']
     validate_env_vars(config['required_vars'])
+    # opt-in, see `response_cache` in config/llms/*.json
+    cache = get_response_cache(config.get('response_cache'), namespace=namespace)
+    # opt-in, see `rate_limit` in config/llms/*.json - shared by all the clients of the provider
+    rate_limiter = get_rate_limiter(provider, config['rate_limit']) if config.get('rate_limit') else None
+    if rate_limiter and cache:
+        # acquire on cache misses only, so cached responses don't wait
+        cache = RateLimitedCache(cache, rate_limiter)
+    callbacks = [RateLimitCallbackHandler(rate_limiter, acquire=cache is None)] if rate_limiter else None
     
     if provider == 'groq':
         return ChatGroq(
@@ -44,6 +73,10 @@ def create_llm_client(config):
             streaming=config.get('stream', True),
             max_tokens=config.get('max_tokens', 8192),
             model_name=os.getenv('GROQ_MODEL_NAME'),
+            http_client=get_http_client(),
+            http_async_client=get_async_http_client(),
+            cache=cache,
+            callbacks=callbacks,
         )
     elif provider == 'anthropic':
         return ChatAnthropic(
@@ -52,6 +85,8 @@ def create_llm_client(config):
             max_tokens=config.get('max_tokens', 1024),
             timeout=None,
             max_retries=2,
+            cache=cache,
+            callbacks=callbacks,
         )
     elif provider == 'azure_openai':
         return AzureChatOpenAI(
@@ -60,6 +95,8 @@ def create_llm_client(config):
             azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT"),
             api_key=os.getenv("AZURE_OPENAI_KEY"),
             azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+            cache=cache,
+            callbacks=callbacks,
         )
     elif provider == 'openai':
         from langchain_openai import ChatOpenAI
@@ -67,6 +104,15 @@ def create_llm_client(config):
             temperature=config.get('temperature', 0),
             model=os.getenv("OPENAI_MODEL_NAME"),
             api_key=os.getenv("OPENAI_API_KEY"),
+            cache=cache,
+            callbacks=callbacks,
+        )
+    elif provider == 'stub':
+        from llms.stub import StubChatModel
+        return StubChatModel(
+            **config.get('config', {}),
+            cache=cache,
+            callbacks=callbacks,
         )
     # Add more LLM providers here as needed
     else:
@@ -138,18 +184,89 @@ def create_embedder_client(config):
     else:
         raise ValueError(f"Unsupported embedder provider: {provider}")
 
-def get_clients(llm_name: str, embedder_name: str):
+_clients_registry: dict[tuple[str, str, str], object] = {}
+_clients_registry_lock = threading.Lock()
+
+def _get_registered_client(kind: str, config: dict, create_client, namespace: str = ''):
+    """Get the client of the given configuration, creating it on first use.
+
+    Clients are keyed by their configuration content, so every caller in the process shares
+    the same client (and its connection pool) for the same configuration.
+    """
+    key = (kind, json.dumps(config, sort_keys=True), namespace)
+    with _clients_registry_lock:
+        if key not in _clients_registry:
+            _clients_registry[key] = create_client(config, namespace=namespace) if namespace else create_client(config)
+        return _clients_registry[key]
+
+def get_llm_client(config, namespace=None):
+    # the namespace separates the response cache entries of different projects
+    namespace = namespace if config.get('response_cache') else None
+    return _get_registered_client('llm', config, create_llm_client, namespace=namespace or '')
+
+def create_cached_embedder_client(config):
+    """Create the embedder of the config, wrapped with its cache (opt-in, see `cache` in config/embedders/*.json)."""
+    embedder_client = create_embedder_client(config)
+    model_key = json.dumps(
+        {'provider': config['provider'], 'config': config.get('config'), 'client': get_client_fingerprint(embedder_client)},
+        sort_keys=True,
+        default=str,
+    )
+    return get_cached_embeddings(embedder_client, config.get('cache'), model_key=model_key)
+
+def get_embedder_client(config):
+    return _get_registered_client('embedder', config, create_cached_embedder_client)
+
+def get_llm_config(llm_name: str) -> dict:
+    """Load the config of the LLM named `llm_name` (`config/llms/<llm_name>.json`)."""
     llm_config_path = Path('config') / 'llms' / f'{llm_name}.json'
-    embedder_config_path = Path('config') / 'embedders' / f'{embedder_name}.json'
-    
-    llm_config = load_config(llm_config_path)
-    embedder_config = load_config(embedder_config_path)
-    
-    llm_client = create_llm_client(llm_config)
-    embedder_client = create_embedder_client(embedder_config)
+    if not is_safe_path(Path('config') / 'llms', llm_config_path):
+        raise ValueError(f"Invalid LLM name: {llm_name}")
+    if not llm_config_path.exists():
+        raise FileNotFoundError(f"LLM {llm_name} not found in {llm_config_path.parent}")
+    return load_config(llm_config_path)
+
+def get_named_llm_client(llm_name: str, namespace: str = None):
+    """Get the shared client of the LLM named `llm_name` - built once per distinct config."""
+    return get_llm_client(get_llm_config(llm_name), namespace=namespace)
+
+def get_named_embedder_client(embedder_name: str):
+    """Get the shared client of the embedder named `embedder_name` (`config/embedders/<embedder_name>.json`)."""
+    return get_embedder_client(load_config(Path('config') / 'embedders' / f'{embedder_name}.json'))
+
+def get_clients(llm_name: str, embedder_name: str, namespace: str = None):
+    llm_client = get_named_llm_client(llm_name, namespace=namespace)
+    embedder_client = get_named_embedder_client(embedder_name)
     
     return llm_client, embedder_client
 
+def get_client_fingerprint(client) -> dict:
+    """Describe an LLM or embedder client by the parameters that affect its output (no secrets)."""
+    # embedders wrapped with a cache return the same embeddings as the embedder itself
+    client = getattr(client, 'wrapped_embeddings', client)
+    fingerprint: dict = {'type': type(client).__name__}
+    for attribute in ('model', 'model_name', 'deployment_name', 'deployment', 'temperature', 'max_tokens', 'top_p'):
+        value = getattr(client, attribute, None)
+        if value is not None:
+            fingerprint[attribute] = value
+    identifying_params = getattr(client, '_identifying_params', None)
+    if identifying_params:
+        fingerprint['params'] = dict(identifying_params)
+    return fingerprint
+
+def copy_llm_client(client, **update):
+    """Get a copy of an LLM client with the fields in `update` replaced.
+
+    pydantic `copy` leaves out the fields excluded from serialization (`callbacks`, `tags`, the provider `client`...),
+    so they are copied explicitly. Private attributes are kept, so the copy shares the response cache keys.
+    """
+    excluded: dict = {
+        name: getattr(client, name)
+        for name, field in type(client).__fields__.items()
+        if field.field_info.exclude
+    }
+    return client.copy(update={**excluded, **update})
+
 def load_config(file_path):
     with open(file_path, 'r') as file:
         return json.load(file)
@@ -204,6 +321,8 @@ def report_success_percentage(folder_path):
     total_files = 0
     success_files = 0
     failed_details = []
+    # validations that could not run (e.g. the judge call failed) - not counted in the success percentage
+    error_details = []
 
     # Iterate through all files in the given directory
     for filename in os.listdir(folder_path):
@@ -218,6 +337,11 @@ def report_success_percentage(folder_path):
                     failed_details.append((filename, ["Error reading file"]))
                     continue
 
+                if isinstance(data, dict) and isinstance(data.get("error"), str):
+                    total_files -= 1
+                    error_details.append((filename, data["error"]))
+                    continue
+
                 # Check each metric in the file
                 has_failure = False
                 file_failures = []
@@ -247,6 +371,10 @@ def report_success_percentage(folder_path):
                 print(f"  {failure}")
     else:
         print("All files succeeded!")
+    if error_details:
+        print(f"Not validated ({len(error_details)} files, not counted in the success percentage):")
+        for filename, error in error_details:
+            print(f"{filename}: {error}")
 
 def list_models():
     def list_model_files(directory, model_type):